@@ -1,8 +1,11 @@
 from flask import Flask, request, abort
-import json
+import os
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from jwks import JWKSKeyStore
+from rbac import Permissions, VerifiedPayload, permission_set
+from token_cache import TokenCache
 
 
 app = Flask(__name__)
@@ -10,6 +13,12 @@ app = Flask(__name__)
 AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
+JWKS_URL = os.environ.get('JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+jwks = JWKSKeyStore(url=JWKS_URL)
+verified_tokens = TokenCache(
+    max_entries=int(os.environ.get('TOKEN_CACHE_SIZE', 1024)),
+    max_age=int(os.environ.get('TOKEN_CACHE_MAX_AGE', 300)))
 
 
 class AuthError(Exception):
@@ -52,35 +61,29 @@ def get_token_auth_header():
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+    payload = verified_tokens.get(token)
+    if payload is not None:
+        return payload
+
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks.get(unverified_header['kid'])
     if rsa_key:
         try:
-            payload = jwt.decode(
+            payload = VerifiedPayload(jwt.decode(
                 token,
                 rsa_key,
                 algorithms=ALGORITHMS,
                 audience=API_AUDIENCE,
                 issuer='https://' + AUTH0_DOMAIN + '/'
-            )
+            ))
 
+            verified_tokens.put(token, payload)
             return payload
 
         except jwt.ExpiredSignatureError:
@@ -105,15 +108,16 @@ def verify_decode_jwt(token):
             }, 400)
 
 def check_permissions(permission, payload):
-    """Checks if payload contains specific permission needed
+    """Checks if payload contains the permission, or the Permissions, needed
     """
-    if 'permissions' not in payload:
+    permissions = permission_set(payload)
+    if permissions is None:
         raise AuthError({
             'code': 'invalid_claims',
             'description': 'Permissions not included in JWT.'
         }, 400)
 
-    if permission not in payload['permissions']:
+    if not Permissions.required(permission).allows(permissions):
         raise AuthError({
             'code': 'unauthorized',
             'description': 'Permission not found.'
@@ -121,7 +125,9 @@ def check_permissions(permission, payload):
     
     return True
 
-def requires_auth(permission='')
+def requires_auth(permission='', all_of=(), any_of=()):
+    required = Permissions.required(permission, all_of=all_of, any_of=any_of)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
@@ -131,7 +137,7 @@ def requires_auth(permission='')
             except:
                 abort(401)
             
-            check_permissions(permission, payload)
+            check_permissions(required, payload)
 
             return f(payload, *args, **kwargs)
 
@@ -140,7 +146,7 @@ def requires_auth(permission='')
     return requires_auth_decorator
 
 @app.route('/headers')
-@requires_auth
+@requires_auth('get:images')
 def headers(payload):
     print(payload)
     return 'Access Granted'
\ No newline at end of file
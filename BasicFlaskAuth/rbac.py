@@ -0,0 +1,57 @@
+'''
+Role-based access control on decoded JWT payloads.
+
+A token's `permissions` claim is turned into a frozenset once, when the
+token is verified, and travels with the payload in the verified-token
+cache. Requirements are compiled into frozensets once, when a route is
+decorated, so checking a request is a couple of set operations whatever
+the number of permissions involved.
+'''
+
+
+class VerifiedPayload(dict):
+    '''A decoded JWT payload, with its permissions precompiled.'''
+
+    def __init__(self, payload):
+        super(VerifiedPayload, self).__init__(payload)
+        self.permissions = permission_set(payload)
+
+
+def permission_set(payload):
+    '''The permissions of `payload` as a frozenset, or None without a permissions claim.'''
+    if isinstance(payload, VerifiedPayload):
+        return payload.permissions
+    permissions = payload.get('permissions')
+    if not isinstance(permissions, (list, tuple, set, frozenset)):
+        return None
+    return frozenset(permissions)
+
+
+class Permissions(object):
+    '''
+    A permission requirement: every permission of `all_of`, and at least
+    one of `any_of` when it is not empty.
+    '''
+
+    def __init__(self, all_of=(), any_of=()):
+        self.all_of = frozenset(all_of)
+        self.any_of = frozenset(any_of)
+
+    @classmethod
+    def required(cls, permission='', all_of=(), any_of=()):
+        '''
+        The requirement of a `requires_auth` decorator. A single
+        `permission` is required when given, or when nothing else is.
+        '''
+        if isinstance(permission, Permissions):
+            return permission
+        all_of = set(all_of)
+        if permission or not (all_of or any_of):
+            all_of.add(permission)
+        return cls(all_of, any_of)
+
+    def allows(self, permissions):
+        return self.all_of <= permissions and (not self.any_of or not self.any_of.isdisjoint(permissions))
+
+    def __repr__(self):
+        return f'<Permissions all_of={sorted(self.all_of)} any_of={sorted(self.any_of)}>'
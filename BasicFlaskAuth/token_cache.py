@@ -0,0 +1,74 @@
+'''
+Verified-token cache.
+
+Remembers the decoded payload of every token that passed signature and
+claims verification, so the same bearer token sent again skips the RSA
+check. Entries are keyed by the SHA-256 digest of the token (the token
+itself is never kept), dropped at the token's `exp` or after `max_age`
+seconds, whichever comes first, and evicted least recently used first
+beyond `max_entries`.
+'''
+
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class TokenCache(object):
+
+    def __init__(self, max_entries=1024, max_age=300):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        '''The cached payload of `token`, or None.'''
+        digest = self._digest(token)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is not None:
+                expires, payload = entry
+                if expires > now:
+                    self.entries.move_to_end(digest)
+                    self.hits += 1
+                    return payload
+                del self.entries[digest]
+            self.misses += 1
+            return None
+
+    def put(self, token, payload):
+        now = time.time()
+        expires = now + self.max_age
+        if 'exp' in payload:
+            expires = min(expires, payload['exp'])
+        if expires <= now:
+            return
+        digest = self._digest(token)
+        with self.lock:
+            self.entries[digest] = (expires, payload)
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0
+            }
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode()).digest()
@@ -1,6 +1,8 @@
 import json
 import dateutil.parser
 import babel
+import babel.dates
+from functools import lru_cache
 from flask import (
   Flask,
   render_template, 
@@ -13,7 +15,6 @@ from flask import (
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import Bundle
-from sqlalchemy import distinct, or_
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import FlaskForm
@@ -22,7 +23,17 @@ from forms import *
 from flask_migrate import Migrate
 import sys
 from models import app, db, Venue, Artist, Show
-from datetime import datetime
+from queries import (
+  venue_areas,
+  booked_artist_ids,
+  booked_venue_ids,
+  load_with_shows,
+  upcoming_shows,
+  decode_cursor)
+import search
+from query_plans import check_query_plans
+from cache import PageCache, venue_key, artist_key
+from instrumentation import SQLInstrumentation
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -31,21 +42,46 @@ from datetime import datetime
 app.config.from_object('config.Config')
 moment = Moment(app)
 db.init_app(app)
+app.cli.add_command(check_query_plans)
+page_cache = PageCache(app)
+SQLInstrumentation(app)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+@lru_cache(maxsize=None)
+def compile_datetime_format(format, locale):
+  """Parsed babel pattern and locale for a named or literal format."""
+  pattern = babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+  return pattern, babel.Locale.parse(locale)
+
+@lru_cache(maxsize=4096)
+def _format_datetime(value, format, locale):
+  pattern, locale = compile_datetime_format(format, locale)
+  return pattern.apply(value, locale)
+
+def format_datetime(value, format='medium', locale=babel.dates.LC_TIME):
   if isinstance(value, str):
-    date = dateutil.parser.parse(value)
-  else:
-    date = value
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+    value = dateutil.parser.parse(value)
+  return _format_datetime(value, format, locale)
+
+def format_datetimes(values, format='medium', locale=babel.dates.LC_TIME):
+  """Format a whole list, compiling the pattern and formatting each distinct value once."""
+  pattern, compiled_locale = compile_datetime_format(format, locale)
+  formatted = {}
+  result = []
+  for value in values:
+    if value not in formatted:
+      date = dateutil.parser.parse(value) if isinstance(value, str) else value
+      formatted[value] = pattern.apply(date, compiled_locale)
+    result.append(formatted[value])
+  return result
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -62,69 +98,31 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@page_cache.cached(lambda: 'venues')
 def venues():
-
-  locals = []
-  venues = Venue.query.all()
-  for place in Venue.query.distinct(Venue.city, Venue.state).all():
-    locals.append({
-      'city': place.city,
-      'state': place.state,
-      'venues': [{
-        'id': venue.id,
-        'name': venue.name,
-      } for venue in venues if
-          venue.city == place.city and venue.state == place.state]
-    })
-  return render_template('pages/venues.html', areas=locals)
+  return render_template('pages/venues.html', areas=venue_areas())
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-  search_term = request.form.get('search_term')
-  search_term_formatted = f'%{search_term}%'
-
-  response = {}
-  data = []
-  count = 0
-
-  for row in Venue.query.filter(Venue.name.ilike(search_term_formatted)):
-    count += 1
-    venue = {}
-    venue['id'] = row.id
-    venue['name'] = row.name
+  search_term = request.form.get('search_term', '')
+  page = request.form.get('page', 1, type=int)
 
-    num_upcoming_shows = db.session.query(Show.id).filter(
-        Show.venue_id == row.id, 
-        Show.start_time > datetime.now()
-    ).count()
-    venue['num_upcoming_shows'] = num_upcoming_shows
+  response = search.search_names(Venue, Show.venue_id, search_term,
+    page=page, per_page=app.config['SEARCH_RESULTS_PER_PAGE'])
 
-    data.append(venue)
-  
-  response['count'] = count
-  response['data'] = data
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
+@page_cache.cached(venue_key)
 def show_venue(venue_id):
+  loaded = load_with_shows(Venue, Artist, venue_id,
+    past_page=request.args.get('past_page', 1, type=int),
+    past_per_page=app.config['PAST_SHOWS_PER_PAGE'])
 
-  past_shows = db.session.query(Artist, Show).join(Show).join(Venue).\
-    filter(
-      Show.venue_id == venue_id,
-      Show.artist_id == Artist.id,
-      Show.start_time < datetime.now()
-    ).\
-      all()
+  if loaded is None:
+    abort(404)
 
-  upcoming_shows = db.session.query(Artist, Show).join(Show).join(Venue).\
-    filter(
-      Show.venue_id == venue_id,
-      Show.artist_id == Artist.id,
-      Show.start_time > datetime.now()
-    ).\
-      all()
-
-  venue = Venue.query.get(venue_id)
+  venue = loaded['entity']
 
   data = {
     'id': venue.id,
@@ -140,19 +138,21 @@ def show_venue(venue_id):
     'seeking_description': venue.seeking_description,
     'image_link': venue.image_link,
     'past_shows': [{
-      'artist_id': artist.id,
-      'artist_name': artist.name,
-      'artist_image_link': artist.image_link,
-      'start_time': show.start_time
-    } for artist, show in past_shows],
+      'artist_id': show['id'],
+      'artist_name': show['name'],
+      'artist_image_link': show['image_link'],
+      'start_time': show['start_time']
+    } for show in loaded['past_shows']],
     'upcoming_shows': [{
-      'artist_id': artist.id,
-      'artist_name': artist.name,
-      'artist_image_link': artist.image_link,
-      'start_time': show.start_time
-    } for artist, show in upcoming_shows],
-    'past_shows_count': len(past_shows),
-    'upcoming_shows_count': len(upcoming_shows)
+      'artist_id': show['id'],
+      'artist_name': show['name'],
+      'artist_image_link': show['image_link'],
+      'start_time': show['start_time']
+    } for show in loaded['upcoming_shows']],
+    'past_shows_count': loaded['past_shows_count'],
+    'upcoming_shows_count': loaded['upcoming_shows_count'],
+    'past_page': loaded['past_page'],
+    'past_has_next': loaded['past_has_next']
   }
 
   return render_template('pages/show_venue.html', venue=data)
@@ -188,6 +188,7 @@ def create_venue_form():
     if error:
       flash('An error occurred. Venue could not be listed.')
     else:
+      page_cache.invalidate('venues')
       flash('Venue was successfully listed!')
     
     return render_template('pages/home.html')
@@ -203,6 +204,7 @@ def delete_venue(venue_id):
   try:
     venue = Venue.query.get(venue_id)
     name = venue.name
+    artist_ids = booked_artist_ids([venue_id])
     db.session.delete(venue)
     db.session.commit()
   except:
@@ -214,12 +216,43 @@ def delete_venue(venue_id):
   if error:
     flash('An error occurred. Venue ' + name + ' could not be deleted')
   else:
+    page_cache.invalidate('venues', 'shows', venue_key(venue_id), *map(artist_key, artist_ids))
     flash('Venue ' + name + ' has been deleted successfully.')
     return jsonify({ 'success': True })
 
+def requested_ids():
+  payload = request.get_json(silent=True)
+  ids = payload.get('ids') if isinstance(payload, dict) else None
+  # bool is an int subclass: true/false are not ids
+  if not isinstance(ids, list) or not all(isinstance(id, int) and not isinstance(id, bool) for id in ids):
+    abort(400)
+  return ids
+
+@app.route('/venues', methods=['DELETE'])
+def delete_venues():
+  venue_ids = requested_ids()
+  error = False
+  try:
+    artist_ids = booked_artist_ids(venue_ids)
+    # shows go with their venue through ON DELETE CASCADE
+    deleted = Venue.query.filter(Venue.id.in_(venue_ids)).delete(synchronize_session=False)
+    db.session.commit()
+  except:
+    error = True
+    db.session.rollback()
+    print(sys.exc_info())
+  finally:
+    db.session.close()
+  if error:
+    abort(500)
+
+  page_cache.invalidate('venues', 'shows', *map(venue_key, venue_ids), *map(artist_key, artist_ids))
+  return jsonify({ 'success': True, 'deleted': deleted })
+
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@page_cache.cached(lambda: 'artists')
 def artists():
   data = []
 
@@ -233,52 +266,25 @@ def artists():
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-  search_term = request.form.get('search_term')
-  search_term_formatted = f'%{search_term}%'
+  search_term = request.form.get('search_term', '')
+  page = request.form.get('page', 1, type=int)
 
-  response = {}
-  data = []
-  count = 0
+  response = search.search_names(Artist, Show.artist_id, search_term,
+    page=page, per_page=app.config['SEARCH_RESULTS_PER_PAGE'])
 
-  for row in Artist.query.filter(Artist.name.ilike(search_term_formatted)):
-    count += 1
-    artist = {}
-    artist['id'] = row.id
-    artist['name'] = row.name
-
-    num_upcoming_shows = db.session.query(Show.id).filter(
-        Show.artist_id == row.id, 
-        Show.start_time > datetime.now()
-    ).count()
-    artist['num_upcoming_shows'] = num_upcoming_shows
-
-    data.append(artist)
-  
-  response['count'] = count
-  response['data'] = data
-
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
+@page_cache.cached(artist_key)
 def show_artist(artist_id):
+  loaded = load_with_shows(Artist, Venue, artist_id,
+    past_page=request.args.get('past_page', 1, type=int),
+    past_per_page=app.config['PAST_SHOWS_PER_PAGE'])
 
-  past_shows = db.session.query(Venue, Show).join(Show).join(Artist).\
-    filter(
-      Show.venue_id == Venue.id,
-      Show.artist_id == artist_id,
-      Show.start_time < datetime.now()
-    ).\
-      all()
-
-  upcoming_shows = db.session.query(Venue, Show).join(Show).join(Artist).\
-    filter(
-      Show.venue_id == Venue.id,
-      Show.artist_id == artist_id,
-      Show.start_time > datetime.now()
-    ).\
-      all()
+  if loaded is None:
+    abort(404)
 
-  artist = Artist.query.get(artist_id)
+  artist = loaded['entity']
 
   data = {
     'id': artist.id,
@@ -293,23 +299,46 @@ def show_artist(artist_id):
     'seeking_description': artist.seeking_description,
     'image_link': artist.image_link,
     'past_shows': [{
-      'venue_id': venue.id,
-      'venue_name': venue.name,
-      'venue_image_link': venue.image_link,
-      'start_time': show.start_time
-    } for venue, show in past_shows],
+      'venue_id': show['id'],
+      'venue_name': show['name'],
+      'venue_image_link': show['image_link'],
+      'start_time': show['start_time']
+    } for show in loaded['past_shows']],
     'upcoming_shows': [{
-      'venue_id': venue.id,
-      'venue_name': venue.name,
-      'venue_image_link': venue.image_link,
-      'start_time': show.start_time
-    } for venue, show in upcoming_shows],
-    'past_shows_count': len(past_shows),
-    'upcoming_shows_count': len(upcoming_shows)
+      'venue_id': show['id'],
+      'venue_name': show['name'],
+      'venue_image_link': show['image_link'],
+      'start_time': show['start_time']
+    } for show in loaded['upcoming_shows']],
+    'past_shows_count': loaded['past_shows_count'],
+    'upcoming_shows_count': loaded['upcoming_shows_count'],
+    'past_page': loaded['past_page'],
+    'past_has_next': loaded['past_has_next']
   }
 
   return render_template('pages/show_artist.html', artist=data)
 
+@app.route('/artists', methods=['DELETE'])
+def delete_artists():
+  artist_ids = requested_ids()
+  error = False
+  try:
+    venue_ids = booked_venue_ids(artist_ids)
+    # shows go with their artist through ON DELETE CASCADE
+    deleted = Artist.query.filter(Artist.id.in_(artist_ids)).delete(synchronize_session=False)
+    db.session.commit()
+  except:
+    error = True
+    db.session.rollback()
+    print(sys.exc_info())
+  finally:
+    db.session.close()
+  if error:
+    abort(500)
+
+  page_cache.invalidate('artists', 'shows', 'venues', *map(artist_key, artist_ids), *map(venue_key, venue_ids))
+  return jsonify({ 'success': True, 'deleted': deleted })
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
@@ -370,6 +399,8 @@ def edit_artist_submission(artist_id):
       flash('An error occurred. Artist ' + request.form.get('name') + ' could not be updated.')
       return redirect(url_for('edit_artist_submission', artist_id=artist_id))
     else:
+      page_cache.invalidate('artists', 'shows', artist_key(artist_id),
+        *map(venue_key, booked_venue_ids([artist_id])))
       flash('Artist ' + request.form.get('name') + ' was updated successfully!')
     
     return redirect(url_for('show_artist', artist_id=artist_id))
@@ -451,6 +482,8 @@ def edit_venue_submission(venue_id):
       flash('An error occurred. Venue ' + request.form.get('name') + ' could not be updated.')
       return redirect(url_for('edit_venue_submission', venue_id=venue_id))
     else:
+      page_cache.invalidate('venues', 'shows', venue_key(venue_id),
+        *map(artist_key, booked_artist_ids([venue_id])))
       flash('Venue ' + request.form.get('name') + ' was updated successfully!')
     
     return redirect(url_for('show_venue', venue_id=venue_id))
@@ -491,6 +524,7 @@ def create_artist_form():
     if error:
       flash('An error occurred. Artist could not be listed.')
     else:
+      page_cache.invalidate('artists')
       flash('Artist was successfully listed!')
     
     return render_template('pages/home.html')
@@ -504,25 +538,28 @@ def create_artist_form():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@page_cache.cached(lambda: 'shows')
 def shows():
-  data = []
+  after = request.args.get('after')
+  if after is not None:
+    try:
+      after = decode_cursor(after)
+    except ValueError:
+      abort(400)
 
-  for row in db.session.query(Artist.id, Artist.name, Artist.image_link
-   ).join(Artist.shows
-   ).add_columns(Show.start_time, Show.venue_id
-   ).filter(Show.start_time > datetime.now()
-   ).order_by(Show.start_time).all():
+  rows, next_cursor = upcoming_shows(after=after, limit=app.config['SHOWS_PER_PAGE'])
+  start_times = format_datetimes([row.start_time for row in rows], 'full')
 
-    show = {}
-    show['venue_id'] = row.venue_id
-    show['venue_name'] = Venue.query.get(row.venue_id).name
-    show['artist_id'] = row.id
-    show['artist_name'] = row.name
-    show['artist_image_link'] = row.image_link
-    show['start_time'] = format_datetime(row.start_time)
-    data.append(show)
+  data = [{
+    'venue_id': row.venue_id,
+    'venue_name': row.venue_name,
+    'artist_id': row.artist_id,
+    'artist_name': row.artist_name,
+    'artist_image_link': row.artist_image_link,
+    'start_time': start_time
+  } for row, start_time in zip(rows, start_times)]
 
-  return render_template('pages/shows.html', shows=data)
+  return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
 
 @app.route('/shows/create', methods=['GET', 'POST'])
 def create_shows():
@@ -546,6 +583,8 @@ def create_shows():
     if error:
       flash('An error occurred. Show could not be listed.')
     else:
+      page_cache.invalidate('venues', 'shows',
+        venue_key(form.venue_id.data), artist_key(form.artist_id.data))
       flash('Show was successfully listed!')
     
     return render_template('pages/home.html')
@@ -557,30 +596,14 @@ def create_shows():
 
 @app.route('/shows/search', methods=['POST'])
 def search_shows():
-  search_term = request.form.get('search_term')
-  search_term_formatted = f'%{search_term}%'
-
-  response = {}
-  data = []
-  count = 0
-
-  for artist_name, show_id, show_start_time, venue_name in db.session.query(Artist.name
-   ).join(Artist.shows
-   ).join(Venue
-   ).add_columns(Show.id, Show.start_time, Venue.name
-   ).filter(Show.start_time > datetime.now()
-   ).filter(or_(Artist.name.ilike(search_term_formatted), Venue.name.ilike(search_term_formatted))
-   ).order_by(Show.start_time):
-    count += 1
-    show = {}
-    show['id'] = show_id
-    show['artist_name'] = artist_name
-    show['venue_name'] = venue_name
-    show['start_time'] = format_datetime(show_start_time)
-    data.append(show)
-  
-  response['count'] = count
-  response['data'] = data
+  search_term = request.form.get('search_term', '')
+  page = request.form.get('page', 1, type=int)
+
+  response = search.search_shows(search_term,
+    page=page, per_page=app.config['SEARCH_RESULTS_PER_PAGE'])
+  start_times = format_datetimes([show['start_time'] for show in response['data']], 'full')
+  for show, start_time in zip(response['data'], start_times):
+    show['start_time'] = start_time
 
   return render_template('pages/search_shows.html', results=response, search_term=search_term)
 
@@ -0,0 +1,342 @@
+'''
+Rendered-page cache for the read-heavy Fyyur pages.
+
+Pages are stored under a logical key ('venues', 'venue:3', ...) and a
+variant (the request path with its query string), so one invalidation of a
+key drops every paginated or filtered variant of that page. Two backends
+are available: an in-process LRU with TTL, and a filesystem store that
+several workers on one host can share.
+
+Each key has a generation, bumped by every invalidation. A page rendered
+while its key was invalidated is served but not stored, so a write never
+leaves a stale page behind for the rest of the TTL.
+'''
+
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import request, session, jsonify
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+class MemoryBackend(object):
+    '''Least-recently-used store with per-entry expiry, local to the process.'''
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.variants = {}
+        self.generations = {}
+        self.cleared = 0
+        self.lock = Lock()
+
+    def generation(self, key):
+        with self.lock:
+            return (self.cleared, self.generations.get(key, 0))
+
+    def get(self, key, variant):
+        with self.lock:
+            entry = self.entries.get((key, variant))
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                self._remove((key, variant))
+                return None
+            self.entries.move_to_end((key, variant))
+            return value
+
+    def set(self, key, variant, value, ttl, generation=None):
+        with self.lock:
+            if generation is not None and generation != (self.cleared, self.generations.get(key, 0)):
+                return
+            self.entries[(key, variant)] = (time.time() + ttl, value)
+            self.entries.move_to_end((key, variant))
+            self.variants.setdefault(key, set()).add(variant)
+            while len(self.entries) > self.max_entries:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+
+    def delete(self, key):
+        with self.lock:
+            self.generations[key] = self.generations.get(key, 0) + 1
+            for variant in self.variants.pop(key, ()):
+                self.entries.pop((key, variant), None)
+
+    def clear(self):
+        with self.lock:
+            self.cleared += 1
+            self.entries.clear()
+            self.variants.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _remove(self, entry_key):
+        key, variant = entry_key
+        self.entries.pop(entry_key, None)
+        variants = self.variants.get(key)
+        if variants is not None:
+            variants.discard(variant)
+            if not variants:
+                del self.variants[key]
+
+
+class FileSystemBackend(object):
+    '''
+    One directory per key and one file per variant. Files are written
+    atomically, so concurrent workers never read a partial page.
+
+    A page file is its expiry time on the first line, followed by the UTF-8
+    page. The directory is created private (0o700) and refused if another
+    user owns it. Beyond `max_entries` pages, expired pages and then the
+    least recently written ones are swept away, checked every
+    `SWEEP_INTERVAL` writes.
+
+    Key generations are marker files next to the key directories, replaced
+    on every invalidation; their inode and mtime identify the generation.
+    '''
+
+    SWEEP_INTERVAL = 32
+    CLEARED = 'cleared.gen'
+
+    def __init__(self, directory, max_entries=512):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.writes = 0
+        self.lock = Lock()
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._check_private(directory)
+
+    def generation(self, key):
+        return (self._stamp(self.CLEARED), self._stamp(self._key_name(key) + '.gen'))
+
+    def get(self, key, variant):
+        path = self._path(key, variant)
+        try:
+            with open(path, 'rb') as f:
+                expires = self._read_expiry(f)
+                value = f.read().decode('utf-8')
+        except (OSError, ValueError):
+            return None
+        if expires < time.time():
+            self._remove(path)
+            return None
+        return value
+
+    def set(self, key, variant, value, ttl, generation=None):
+        if generation is not None and generation != self.generation(key):
+            return
+        key_dir = self._key_dir(key)
+        path = self._path(key, variant)
+        try:
+            os.makedirs(key_dir, mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=key_dir)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(f'{time.time() + ttl!r}\n'.encode())
+                f.write(value.encode('utf-8'))
+            os.replace(tmp_path, path)
+        except OSError:
+            self._remove(tmp_path)
+            return
+        # an invalidation may have landed between the check and the rename
+        if generation is not None and generation != self.generation(key):
+            self._remove(path)
+
+        with self.lock:
+            self.writes += 1
+            sweep = self.writes % self.SWEEP_INTERVAL == 0
+        if sweep:
+            self.sweep()
+
+    def delete(self, key):
+        self._bump(self._key_name(key) + '.gen')
+        shutil.rmtree(self._key_dir(key), ignore_errors=True)
+
+    def clear(self):
+        self._bump(self.CLEARED)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def sweep(self):
+        '''Remove expired pages, then the oldest ones beyond `max_entries`.'''
+        now = time.time()
+        pages = []
+        for path in self._page_paths():
+            try:
+                with open(path, 'rb') as f:
+                    expires = self._read_expiry(f)
+                written = os.stat(path).st_mtime
+            except (OSError, ValueError):
+                continue
+            if expires < now:
+                self._remove(path)
+            else:
+                pages.append((written, path))
+
+        excess = len(pages) - self.max_entries
+        if excess > 0:
+            pages.sort()
+            for _, path in pages[:excess]:
+                self._remove(path)
+
+    def __len__(self):
+        return sum(1 for _ in self._page_paths())
+
+    def _page_paths(self):
+        for key_name in os.listdir(self.directory):
+            key_dir = os.path.join(self.directory, key_name)
+            if not os.path.isdir(key_dir):
+                continue
+            try:
+                names = os.listdir(key_dir)
+            except OSError:
+                continue
+            for name in names:
+                yield os.path.join(key_dir, name)
+
+    def _key_name(self, key):
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _key_dir(self, key):
+        return os.path.join(self.directory, self._key_name(key))
+
+    def _path(self, key, variant):
+        return os.path.join(self._key_dir(key), hashlib.sha1(variant.encode()).hexdigest())
+
+    def _stamp(self, name):
+        try:
+            st = os.stat(os.path.join(self.directory, name))
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def _bump(self, name):
+        # a new file, hence a new inode, even when the mtime does not move
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        os.close(fd)
+        os.replace(tmp_path, os.path.join(self.directory, name))
+
+    @staticmethod
+    def _read_expiry(f):
+        return float(f.readline())
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _check_private(directory):
+        st = os.lstat(directory)
+        if not stat.S_ISDIR(st.st_mode):
+            raise ValueError(f'PAGE_CACHE_DIR is not a directory: {directory}')
+        if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+            raise ValueError(f'PAGE_CACHE_DIR is owned by another user: {directory}')
+        if st.st_mode & 0o077:
+            os.chmod(directory, 0o700)
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+class PageCache(object):
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('PAGE_CACHE_BACKEND')
+        self.ttl = app.config.get('PAGE_CACHE_TTL', 300)
+
+        if backend == 'memory':
+            self.backend = MemoryBackend(app.config.get('PAGE_CACHE_MAX_ENTRIES', 512))
+        elif backend == 'filesystem':
+            self.backend = FileSystemBackend(app.config['PAGE_CACHE_DIR'],
+                                             app.config.get('PAGE_CACHE_MAX_ENTRIES', 512))
+        elif backend is not None:
+            raise ValueError(f'Unknown PAGE_CACHE_BACKEND: {backend}')
+
+        app.add_url_rule('/cache/stats', 'cache_stats', lambda: jsonify(self.stats()))
+
+    def cached(self, key_func):
+        '''
+        Cache the rendered HTML of a GET view. `key_func` receives the view
+        arguments and returns the page's logical key.
+        '''
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # pending flash messages are rendered into the page layout
+                if self.backend is None or request.method != 'GET' or session.get('_flashes'):
+                    return view(*args, **kwargs)
+
+                key = key_func(*args, **kwargs)
+                variant = request.full_path
+                page = self.backend.get(key, variant)
+                if page is not None:
+                    self._count('hits')
+                    return page
+
+                self._count('misses')
+                generation = self.backend.generation(key)
+                page = view(*args, **kwargs)
+                if isinstance(page, str):
+                    self.backend.set(key, variant, page, self.ttl, generation)
+                return page
+            return wrapper
+        return decorator
+
+    def invalidate(self, *keys):
+        if self.backend is None:
+            return
+        for key in keys:
+            self.backend.delete(key)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__ if self.backend is not None else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.backend) if self.backend is not None else 0
+        }
+
+    def _count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+#----------------------------------------------------------------------------#
+# Keys.
+#----------------------------------------------------------------------------#
+
+def venue_key(venue_id):
+    return f'venue:{venue_id}'
+
+def artist_key(artist_id):
+    return f'artist:{artist_id}'
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 class Config(object):
     DEBUG = True
@@ -8,4 +9,15 @@ class Config(object):
     basedir = os.path.abspath(os.path.dirname(__file__))
 
     SQLALCHEMY_DATABASE_URI = 'postgres://felipegontijo@localhost:5432/fyyur'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    SEARCH_RESULTS_PER_PAGE = 20
+    SHOWS_PER_PAGE = 30
+    PAST_SHOWS_PER_PAGE = 30
+
+    # 'memory', 'filesystem' (shared by workers on one host) or None
+    PAGE_CACHE_BACKEND = 'memory'
+    PAGE_CACHE_TTL = 300
+    PAGE_CACHE_MAX_ENTRIES = 512
+    # created 0o700; refused if another user owns it
+    PAGE_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'fyyur-page-cache')
\ No newline at end of file
@@ -0,0 +1,163 @@
+'''
+Per-request SQL instrumentation.
+
+Counts the statements a request runs, the time spent in the database, the
+slowest statement and the total request time, using SQLAlchemy engine
+events. The numbers are exposed as X-SQL-* / X-Request-Time-Ms response
+headers (debug mode by default), logged for slow requests, and aggregated
+into per-route latency histograms served as JSON.
+
+Configuration:
+    SQL_INSTRUMENTATION_HEADERS     send the headers (defaults to app.debug)
+    SQL_INSTRUMENTATION_SLOW_MS     slow-request log threshold (500)
+    SQL_INSTRUMENTATION_METRICS_URL metrics endpoint ('/metrics'), or None
+'''
+
+import time
+from threading import Lock
+
+from flask import g, request, jsonify, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# upper bounds, in milliseconds, of the latency histogram buckets
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+# The start time lives on the execution context, which is dropped with the
+# statement: after_cursor_execute does not fire for a failing statement, so
+# anything kept on the connection would pile up for the connection's life.
+# The few statements SQLAlchemy runs without a context use one slot on the
+# connection, overwritten rather than stacked.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._instrumentation_start = time.perf_counter()
+    else:
+        conn.info['instrumentation_start'] = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        started = getattr(context, '_instrumentation_start', None)
+    else:
+        started = conn.info.pop('instrumentation_start', None)
+    if started is None or not has_app_context():
+        return
+    stats = g.get('sql_stats')
+    if stats is None:
+        return
+
+    elapsed = (time.perf_counter() - started) * 1000
+    stats['queries'] += 1
+    stats['db_ms'] += elapsed
+    if elapsed > stats['slowest_ms']:
+        stats['slowest_ms'] = elapsed
+        stats['slowest_statement'] = statement
+
+_listening = False
+
+def _listen():
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+
+class RouteMetrics(object):
+    '''Request count, latency histogram and SQL totals for one route.'''
+
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.queries = 0
+        self.db_ms = 0.0
+
+    def observe(self, request_ms, stats):
+        self.count += 1
+        self.total_ms += request_ms
+        self.max_ms = max(self.max_ms, request_ms)
+        self.queries += stats['queries']
+        self.db_ms += stats['db_ms']
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if request_ms <= bound:
+                self.buckets[i] += 1
+                break
+
+    def format(self):
+        return {
+            'count': self.count,
+            'latency_ms': {
+                'mean': self.total_ms / self.count if self.count else 0,
+                'max': self.max_ms,
+                'histogram': {
+                    ('+Inf' if bound == float('inf') else str(bound)): n
+                    for bound, n in zip(LATENCY_BUCKETS, self.buckets)
+                }
+            },
+            'queries_per_request': self.queries / self.count if self.count else 0,
+            'db_ms_per_request': self.db_ms / self.count if self.count else 0
+        }
+
+
+class SQLInstrumentation(object):
+
+    def __init__(self, app=None):
+        self.routes = {}
+        self.lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        _listen()
+        self.app = app
+        self.headers = app.config.get('SQL_INSTRUMENTATION_HEADERS', app.debug)
+        self.slow_ms = app.config.get('SQL_INSTRUMENTATION_SLOW_MS', 500)
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+        metrics_url = app.config.get('SQL_INSTRUMENTATION_METRICS_URL', '/metrics')
+        if metrics_url:
+            app.add_url_rule(metrics_url, 'sql_metrics', self._metrics)
+
+    def _start(self):
+        g.request_started = time.perf_counter()
+        g.sql_stats = {
+            'queries': 0,
+            'db_ms': 0.0,
+            'slowest_ms': 0.0,
+            'slowest_statement': None
+        }
+
+    def _finish(self, response):
+        stats = g.get('sql_stats')
+        if stats is None:
+            return response
+        request_ms = (time.perf_counter() - g.request_started) * 1000
+
+        route = f'{request.method} {request.url_rule.rule if request.url_rule else "<unmatched>"}'
+        with self.lock:
+            self.routes.setdefault(route, RouteMetrics()).observe(request_ms, stats)
+
+        if self.headers:
+            response.headers['X-SQL-Queries'] = str(stats['queries'])
+            response.headers['X-SQL-Time-Ms'] = f'{stats["db_ms"]:.2f}'
+            response.headers['X-SQL-Slowest-Ms'] = f'{stats["slowest_ms"]:.2f}'
+            response.headers['X-Request-Time-Ms'] = f'{request_ms:.2f}'
+
+        if request_ms >= self.slow_ms:
+            self.app.logger.warning(
+                'Slow request %s: %.1f ms, %d queries, %.1f ms in database, slowest %.1f ms: %s',
+                route, request_ms, stats['queries'], stats['db_ms'],
+                stats['slowest_ms'], stats['slowest_statement'])
+
+        return response
+
+    def _metrics(self):
+        with self.lock:
+            routes = {route: metrics.format() for route, metrics in self.routes.items()}
+        return jsonify({
+            'success': True,
+            'routes': routes
+        })
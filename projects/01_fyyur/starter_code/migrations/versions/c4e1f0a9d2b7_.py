@@ -0,0 +1,39 @@
+"""trigram indexes for name search
+
+Revision ID: c4e1f0a9d2b7
+Revises: 8d134a24080e
+Create Date: 2026-10-18 09:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e1f0a9d2b7'
+down_revision = '8d134a24080e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_venues_name_trgm', 'venues', ['name'],
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'},
+            postgresql_concurrently=True)
+        op.create_index('ix_artists_name_trgm', 'artists', ['name'],
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'},
+            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_artists_name_trgm', table_name='artists',
+            postgresql_concurrently=True)
+        op.drop_index('ix_venues_name_trgm', table_name='venues',
+            postgresql_concurrently=True)
@@ -0,0 +1,38 @@
+"""indexes for past/upcoming show lookups
+
+Revision ID: e07b5d3a81c4
+Revises: c4e1f0a9d2b7
+Create Date: 2026-10-18 10:03:57.631092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e07b5d3a81c4'
+down_revision = 'c4e1f0a9d2b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, and only
+    # takes a SHARE UPDATE EXCLUSIVE lock so shows stay writable meanwhile
+    with op.get_context().autocommit_block():
+        op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'],
+            postgresql_concurrently=True)
+        op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'],
+            postgresql_concurrently=True)
+        op.create_index('ix_shows_start_time', 'shows', ['start_time'],
+            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_shows_start_time', table_name='shows',
+            postgresql_concurrently=True)
+        op.drop_index('ix_shows_artist_id_start_time', table_name='shows',
+            postgresql_concurrently=True)
+        op.drop_index('ix_shows_venue_id_start_time', table_name='shows',
+            postgresql_concurrently=True)
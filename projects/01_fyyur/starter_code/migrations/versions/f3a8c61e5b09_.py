@@ -0,0 +1,40 @@
+"""cascade show deletes from venues and artists
+
+Revision ID: f3a8c61e5b09
+Revises: e07b5d3a81c4
+Create Date: 2026-10-18 11:26:08.417733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8c61e5b09'
+down_revision = 'e07b5d3a81c4'
+branch_labels = None
+depends_on = None
+
+
+def replace_foreign_key(column, table, ondelete):
+    # swap the constraint in one statement, then validate it in its own
+    # transaction so the scan of shows does not run under the ACCESS
+    # EXCLUSIVE lock taken by the swap
+    constraint = f'shows_{column}_fkey'
+    op.execute(
+        f'ALTER TABLE shows DROP CONSTRAINT {constraint}, '
+        f'ADD CONSTRAINT {constraint} FOREIGN KEY ({column}) '
+        f'REFERENCES {table} (id){ondelete} NOT VALID'
+    )
+    with op.get_context().autocommit_block():
+        op.execute(f'ALTER TABLE shows VALIDATE CONSTRAINT {constraint}')
+
+
+def upgrade():
+    replace_foreign_key('venue_id', 'venues', ' ON DELETE CASCADE')
+    replace_foreign_key('artist_id', 'artists', ' ON DELETE CASCADE')
+
+
+def downgrade():
+    replace_foreign_key('artist_id', 'artists', '')
+    replace_foreign_key('venue_id', 'venues', '')
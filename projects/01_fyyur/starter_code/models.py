@@ -23,7 +23,12 @@ class Venue(db.Model):
     seeking_description = db.Column(db.String(500))
     image_link = db.Column(db.String(500), nullable=False, unique=True)
 
-    shows = db.relationship('Show', backref='venue', cascade='all, delete-orphan', lazy=True)
+    shows = db.relationship('Show', backref='venue', cascade='all, delete-orphan', lazy=True, passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_venues_name_trgm', 'name',
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     def __repr__(self):
         return f'<Venue ID: {self.id}, name: {self.name}>'
@@ -46,7 +51,12 @@ class Artist(db.Model):
     seeking_description = db.Column(db.String(500))
     image_link = db.Column(db.String(500), nullable=False, unique=True)
     
-    shows = db.relationship('Show', backref='artist', cascade='all, delete-orphan', lazy=True)
+    shows = db.relationship('Show', backref='artist', cascade='all, delete-orphan', lazy=True, passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_artists_name_trgm', 'name',
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     def __repr__(self):
         return f'<Artist ID: {self.id}, name: {self.name}>'
@@ -57,10 +67,16 @@ class Show(db.Model):
     __tablename__ = 'shows'
 
     id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), nullable=False)
     start_time = db.Column(db.DateTime(timezone=False), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_shows_start_time', 'start_time'),
+    )
+
     def __repr__(self):
         return f'<Show ID: {self.id}, artist ID: {self.artist_id}, venue ID: {self.venue_id}>'
     
@@ -0,0 +1,225 @@
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import and_, func, or_, tuple_
+
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Aggregates.
+#----------------------------------------------------------------------------#
+
+def upcoming_show_counts(key, now=None):
+    '''
+    Subquery counting upcoming shows grouped by `key`
+    (Show.venue_id or Show.artist_id), exposed as `owner_id` and
+    `num_upcoming_shows`.
+    '''
+    if now is None:
+        now = datetime.now()
+
+    return db.session.query(
+        key.label('owner_id'),
+        func.count(Show.id).label('num_upcoming_shows')
+    ).filter(Show.start_time > now
+    ).group_by(key
+    ).subquery()
+
+#----------------------------------------------------------------------------#
+# Venues.
+#----------------------------------------------------------------------------#
+
+def venue_areas(now=None):
+    '''
+    Venues grouped by (city, state), built from a single ordered query.
+    Each area and each venue carries its number of upcoming shows.
+    '''
+    counts = upcoming_show_counts(Show.venue_id, now)
+
+    rows = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        func.coalesce(counts.c.num_upcoming_shows, 0).label('num_upcoming_shows')
+    ).outerjoin(counts, counts.c.owner_id == Venue.id
+    ).order_by(Venue.state, Venue.city, Venue.name)
+
+    areas = []
+    for (city, state), group in groupby(rows, key=lambda row: (row.city, row.state)):
+        venues = [{
+            'id': row.id,
+            'name': row.name,
+            'num_upcoming_shows': row.num_upcoming_shows
+        } for row in group]
+
+        areas.append({
+            'city': city,
+            'state': state,
+            'venues': venues,
+            'num_upcoming_shows': sum(venue['num_upcoming_shows'] for venue in venues)
+        })
+
+    return areas
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+def booked_artist_ids(venue_ids):
+    '''Ids of the artists that have, or had, a show at any of the venues.'''
+    return [artist_id for artist_id, in db.session.query(Show.artist_id
+    ).filter(Show.venue_id.in_(venue_ids)
+    ).distinct()]
+
+def booked_venue_ids(artist_ids):
+    '''Ids of the venues where any of the artists has, or had, a show.'''
+    return [venue_id for venue_id, in db.session.query(Show.venue_id
+    ).filter(Show.artist_id.in_(artist_ids)
+    ).distinct()]
+
+#----------------------------------------------------------------------------#
+# Details.
+#----------------------------------------------------------------------------#
+
+def load_with_shows(model, counterpart, entity_id, past_page=1, past_per_page=None, now=None):
+    '''
+    Load a Venue or Artist together with its shows in one query.
+
+    Each show is joined to its `counterpart` (the Artist of a venue's show,
+    the Venue of an artist's show) and split into past and upcoming against
+    a single `now`. Past shows are listed most recent first and, when
+    `past_per_page` is set, only page `past_page` of them is fetched: they
+    are numbered with a row_number() window and the page is cut in SQL, so
+    the rows read stay bounded however many past shows there are. Their
+    total comes from a count subquery of the same statement.
+    Returns None if the entity does not exist.
+    '''
+    if now is None:
+        now = datetime.now()
+
+    if model is Venue:
+        key, counterpart_key = Show.venue_id, Show.artist_id
+    else:
+        key, counterpart_key = Show.artist_id, Show.venue_id
+
+    past_page = max(past_page, 1)
+    is_upcoming = Show.start_time > now
+    shows = db.session.query(
+        Show.id.label('show_id'),
+        key.label('owner_id'),
+        Show.start_time.label('start_time'),
+        counterpart_key.label('counterpart_id'),
+        func.row_number().over(
+            partition_by=is_upcoming,
+            order_by=(Show.start_time.desc(), Show.id.desc())
+        ).label('past_rank')
+    ).filter(key == entity_id
+    ).subquery()
+
+    shown = shows.c.owner_id == model.id
+    if past_per_page:
+        start = (past_page - 1) * past_per_page
+        shown = and_(shown, or_(
+            shows.c.start_time > now,
+            shows.c.past_rank.between(start + 1, start + past_per_page)
+        ))
+
+    past_shows_count = db.session.query(func.count(Show.id)
+    ).filter(key == entity_id, Show.start_time <= now
+    ).as_scalar()
+
+    rows = db.session.query(
+        model,
+        past_shows_count.label('past_shows_count'),
+        # keeps shows of the same counterpart at the same time from being uniqued away
+        shows.c.show_id,
+        shows.c.start_time,
+        counterpart.id,
+        counterpart.name,
+        counterpart.image_link
+    ).outerjoin(shows, shown
+    ).outerjoin(counterpart, counterpart.id == shows.c.counterpart_id
+    ).filter(model.id == entity_id
+    ).order_by(shows.c.start_time, shows.c.past_rank.desc()).all()
+
+    if not rows:
+        return None
+
+    past_shows = []
+    upcoming_shows = []
+    for _, _, _, start_time, counterpart_id, name, image_link in rows:
+        if start_time is None:
+            continue
+        show = {
+            'id': counterpart_id,
+            'name': name,
+            'image_link': image_link,
+            'start_time': start_time
+        }
+        if start_time > now:
+            upcoming_shows.append(show)
+        else:
+            past_shows.append(show)
+
+    past_shows.reverse()
+    past_shows_count = rows[0][1]
+
+    return {
+        'entity': rows[0][0],
+        'past_shows': past_shows,
+        'upcoming_shows': upcoming_shows,
+        'past_shows_count': past_shows_count,
+        'upcoming_shows_count': len(upcoming_shows),
+        'past_page': past_page,
+        'past_has_next': bool(past_per_page) and past_page * past_per_page < past_shows_count
+    }
+
+#----------------------------------------------------------------------------#
+# Shows.
+#----------------------------------------------------------------------------#
+
+def encode_cursor(start_time, show_id):
+    return f'{start_time.isoformat()},{show_id}'
+
+def decode_cursor(cursor):
+    '''
+    Parse an `encode_cursor()` token back into (start_time, show_id).
+    Raises ValueError on malformed input.
+    '''
+    start_time, show_id = cursor.rsplit(',', 1)
+    return datetime.fromisoformat(start_time), int(show_id)
+
+def upcoming_shows(after=None, limit=30, now=None):
+    '''
+    One page of upcoming shows joined to their artist and venue, ordered by
+    (start_time, id). `after` is a (start_time, id) keyset cursor; the
+    cursor for the following page is returned alongside the rows, or None
+    on the last page.
+    '''
+    if now is None:
+        now = datetime.now()
+
+    query = db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(Venue, Venue.id == Show.venue_id
+    ).join(Artist, Artist.id == Show.artist_id
+    ).filter(Show.start_time > now)
+
+    if after is not None:
+        query = query.filter(tuple_(Show.start_time, Show.id) > tuple_(*after))
+
+    rows = query.order_by(Show.start_time, Show.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+
+    return rows, next_cursor
@@ -0,0 +1,87 @@
+'''
+Query-plan check for the indexes the show pages depend on.
+
+`flask check-query-plans` fails when a supporting index is missing from
+the models, missing from the database, or no longer chosen by the planner
+for the query it exists for.
+'''
+
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql
+
+from models import db, Show
+
+def indexed_queries(now):
+    '''(description, query, index the planner must use) for each checked query.'''
+    return [
+        ('upcoming shows at a venue',
+            db.session.query(Show.id).filter(Show.venue_id == 1, Show.start_time > now),
+            'ix_shows_venue_id_start_time'),
+        ('past shows at a venue',
+            db.session.query(Show.id).filter(Show.venue_id == 1, Show.start_time < now),
+            'ix_shows_venue_id_start_time'),
+        ('upcoming shows of an artist',
+            db.session.query(Show.id).filter(Show.artist_id == 1, Show.start_time > now),
+            'ix_shows_artist_id_start_time'),
+        ('past shows of an artist',
+            db.session.query(Show.id).filter(Show.artist_id == 1, Show.start_time < now),
+            'ix_shows_artist_id_start_time'),
+        ('upcoming shows listing',
+            db.session.query(Show.id).filter(Show.start_time > now
+            ).order_by(Show.start_time, Show.id).limit(30),
+            'ix_shows_start_time'),
+    ]
+
+def plan_indexes(plan):
+    '''All index names referenced anywhere in an EXPLAIN (FORMAT JSON) plan.'''
+    found = set()
+    if 'Index Name' in plan:
+        found.add(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        found |= plan_indexes(child)
+    return found
+
+def explain(connection, query):
+    compiled = query.statement.compile(dialect=postgresql.dialect())
+    result = connection.execute('EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params)
+    return result.scalar()[0]['Plan']
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans():
+    '''Verify that show lookups are served by their indexes.'''
+    checks = indexed_queries(datetime.now())
+    expected = {index for _, _, index in checks}
+    failures = []
+
+    declared = {index.name for index in Show.__table__.indexes}
+    for index in sorted(expected - declared):
+        failures.append(f'{index} is not declared on the Show model')
+
+    existing = {index['name'] for index in inspect(db.engine).get_indexes(Show.__tablename__)}
+    for index in sorted(expected - existing):
+        failures.append(f'{index} does not exist in the database')
+
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    try:
+        # small development tables would otherwise always be seq-scanned
+        connection.execute('SET LOCAL enable_seqscan = off')
+        for description, query, index in checks:
+            used = plan_indexes(explain(connection, query))
+            if index in used:
+                click.echo(f'ok    {description}: {index}')
+            else:
+                failures.append(f'{description} does not use {index} (uses: {", ".join(sorted(used)) or "no index"})')
+    finally:
+        transaction.rollback()
+        connection.close()
+
+    if failures:
+        for failure in failures:
+            click.echo(f'FAIL  {failure}', err=True)
+        raise SystemExit(1)
@@ -0,0 +1,124 @@
+'''
+Name search shared by the venue, artist and show search endpoints.
+
+Matching is a case-insensitive substring match or a trigram similarity
+match (pg_trgm's `%` operator, which tolerates typos). Both are served by
+the GIN trigram indexes on venues.name and artists.name, and hits are
+ranked by trigram similarity to the search term.
+'''
+
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_
+
+from models import db, Venue, Artist, Show
+
+def escape_like(search_term):
+    return search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def name_match(column, search_term):
+    '''
+    Filter and rank expressions for matching `column` against `search_term`.
+    '''
+    pattern = f'%{escape_like(search_term)}%'
+    # pg_trgm's similarity operator `%`, doubled for psycopg2's paramstyle
+    condition = or_(
+        column.ilike(pattern, escape='\\'),
+        column.op('%%')(search_term)
+    )
+    rank = func.similarity(column, search_term)
+    return condition, rank
+
+def results_page(rows, count, page, per_page, format_row):
+    return {
+        'count': count,
+        'page': page,
+        'per_page': per_page,
+        'has_next': page * per_page < count,
+        'data': [format_row(row) for row in rows]
+    }
+
+#----------------------------------------------------------------------------#
+# Venues and artists.
+#----------------------------------------------------------------------------#
+
+def search_names(model, key, search_term, page=1, per_page=20, now=None):
+    '''
+    One page of `model` rows whose name matches `search_term`, best match
+    first, with `num_upcoming_shows` aggregated for the whole page in a
+    single query. `key` is the Show column pointing at `model`.
+    '''
+    if now is None:
+        now = datetime.now()
+    page = max(page, 1)
+    condition, rank = name_match(model.name, search_term)
+
+    count = db.session.query(func.count(model.id)).filter(condition).scalar()
+
+    hits = db.session.query(
+        model.id,
+        model.name,
+        rank.label('rank')
+    ).filter(condition
+    ).order_by(rank.desc(), model.name, model.id
+    ).limit(per_page
+    ).offset((page - 1) * per_page
+    ).subquery()
+
+    rows = db.session.query(
+        hits.c.id,
+        hits.c.name,
+        func.count(Show.id).label('num_upcoming_shows')
+    ).outerjoin(Show, and_(key == hits.c.id, Show.start_time > now)
+    ).group_by(hits.c.id, hits.c.name, hits.c.rank
+    ).order_by(hits.c.rank.desc(), hits.c.name, hits.c.id)
+
+    return results_page(rows, count, page, per_page, lambda row: {
+        'id': row.id,
+        'name': row.name,
+        'num_upcoming_shows': row.num_upcoming_shows
+    })
+
+#----------------------------------------------------------------------------#
+# Shows.
+#----------------------------------------------------------------------------#
+
+def search_shows(search_term, page=1, per_page=20, now=None):
+    '''
+    One page of upcoming shows whose artist or venue name matches
+    `search_term`, best match first, then soonest first.
+    '''
+    if now is None:
+        now = datetime.now()
+    page = max(page, 1)
+    artist_condition, artist_rank = name_match(Artist.name, search_term)
+    venue_condition, venue_rank = name_match(Venue.name, search_term)
+
+    artist_hits = db.session.query(Artist.id).filter(artist_condition)
+    venue_hits = db.session.query(Venue.id).filter(venue_condition)
+    condition = and_(
+        Show.start_time > now,
+        or_(Show.artist_id.in_(artist_hits), Show.venue_id.in_(venue_hits))
+    )
+    rank = func.greatest(artist_rank, venue_rank)
+
+    count = db.session.query(func.count(Show.id)).filter(condition).scalar()
+
+    rows = db.session.query(
+        Show.id,
+        Show.start_time,
+        Artist.name.label('artist_name'),
+        Venue.name.label('venue_name')
+    ).join(Artist, Artist.id == Show.artist_id
+    ).join(Venue, Venue.id == Show.venue_id
+    ).filter(condition
+    ).order_by(rank.desc(), Show.start_time, Show.id
+    ).limit(per_page
+    ).offset((page - 1) * per_page)
+
+    return results_page(rows, count, page, per_page, lambda row: {
+        'id': row.id,
+        'artist_name': row.artist_name,
+        'venue_name': row.venue_name,
+        'start_time': row.start_time
+    })
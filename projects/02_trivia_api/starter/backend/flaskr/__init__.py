@@ -1,65 +1,118 @@
 import os
-from flask import Flask, request, abort, jsonify
+import csv
+from flask import Flask, Response, request, abort, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
-from models import setup_db, Question, Category
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from models import setup_db, database_path, db, Question, Category
+from instrumentation import SQLInstrumentation
+from .cache import VersionedCache, share_versions, stamp_for
+from .sampling import QuestionSampler, ALL_CATEGORIES
+from .quiz_sessions import QuizSessions
+from .search import question_search, stream_json
+from . import bulk
+from .serialization import dumps, json_response, requested_fields, included, compress_response
 
 QUESTIONS_PER_PAGE = 10
+QUIZ_SESSION_TTL = 3600
+QUIZ_SESSION_LIMIT = 100000
+SEARCH_MAX_PER_PAGE = 100
+# longest a cached value may miss other workers' writes, without CACHE_VERSION_DIR
+CACHE_TTL = 60
 
 def paginate_questions(request, query):
-  """Return paginated questions"""
-  page = request.args.get('page', 1, type=int)
-  start = (page - 1) * QUESTIONS_PER_PAGE
-  end = start + QUESTIONS_PER_PAGE
+  """Return one page of questions, limited in the database.
 
-  current_questions = query[start:end]
+  `?after=<id>` returns the questions following that id (keyset mode),
+  otherwise `?page=<n>` is used with LIMIT/OFFSET.
+  """
+  query = query.order_by(Question.id)
 
-  return current_questions
+  after = request.args.get('after', type=int)
+  if after is not None:
+    return query.filter(Question.id > after).limit(QUESTIONS_PER_PAGE).all()
+
+  page = max(request.args.get('page', 1, type=int), 1)
+  return query.limit(QUESTIONS_PER_PAGE).offset((page - 1) * QUESTIONS_PER_PAGE).all()
 
 def create_app(test_config=None):
   """Create and set up the Flask app"""
   app = Flask(__name__)
-  setup_db(app)
+  if test_config is not None:
+    app.config.update(test_config)
+
+  setup_db(app, app.config.get('DATABASE_PATH', database_path))
+  SQLInstrumentation(app)
   CORS(app, resources={r'/api/*': {'origins': '*'}})
+  app.cli.add_command(bulk.import_questions_command)
+  app.cli.add_command(bulk.export_questions_command)
+
+  # point every worker at the same directory to share cache versions
+  version_dir = app.config.get('CACHE_VERSION_DIR', os.environ.get('TRIVIA_CACHE_VERSION_DIR'))
+  if version_dir:
+    share_versions(version_dir)
+
+  cache_ttl = app.config.get('CACHE_TTL', CACHE_TTL)
+  question_count = VersionedCache(lambda: Question.query.count(), stamp_for(Question), cache_ttl)
+  categories = VersionedCache(
+    lambda: {category.id: category.type for category in Category.query.order_by(Category.id)},
+    stamp_for(Category),
+    cache_ttl
+  )
+  categories_json = VersionedCache(lambda: dumps(categories.get()), stamp_for(Category), cache_ttl)
+  sampler = QuestionSampler(cache_ttl)
+  quiz_sessions = QuizSessions(ttl=QUIZ_SESSION_TTL, max_sessions=QUIZ_SESSION_LIMIT)
 
   @app.after_request
   def after_request(response):
     """Define CORS headers"""
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET, POST, DELETE')
-    return response
+    return compress_response(response)
 
   @app.route('/categories')
   def get_categories():
     """GET all categories"""
-    categories = Category.query.all()
-    formatted_categories = {category.id: category.type for category in categories}
+    return json_response({
+      'success': True
+    }, categories=categories_json.get())
+
+  @app.route('/categories/question-counts')
+  def get_category_question_counts():
+    """GET the number of questions in each category"""
+    counts = db.session.query(Category.id, func.count(Question.id)
+      ).outerjoin(Question, Question.category == Category.id
+      ).group_by(Category.id)
 
     return jsonify({
       'success': True,
-      'categories': formatted_categories
+      'counts': {category_id: count for category_id, count in counts}
     })
 
   @app.route('/questions')
   def get_paginated_questions():
     """GET a list of paginated questions"""
-    questions = Question.query.all()
-    formatted_questions = [question.format() for question in questions]
-    current_questions = paginate_questions(request, formatted_questions)
-
-    categories = {category.id: category.type for category in Category.query.all()}
+    fields = requested_fields()
+    include = included(('total_questions', 'categories', 'current_category'))
+    questions = paginate_questions(request, Question.query)
+    current_questions = [question.format(fields) for question in questions]
 
     if len(current_questions) == 0:
       abort(404)
-    
-    return jsonify({
+
+    data = {
       'success': True,
       'questions': current_questions,
-      'total_questions': len(questions),
-      'categories': categories,
-      'current_category': None
-    })
+      'next_after': questions[-1].id if len(questions) == QUESTIONS_PER_PAGE else None
+    }
+    if 'total_questions' in include:
+      data['total_questions'] = question_count.get()
+    if 'current_category' in include:
+      data['current_category'] = None
+    if 'categories' in include:
+      return json_response(data, categories=categories_json.get())
+    return json_response(data)
 
   @app.route('/questions/<int:question_id>', methods=['DELETE'])
   def delete_question(question_id):
@@ -84,69 +137,109 @@ def create_app(test_config=None):
     difficulty = request_data['difficulty']
     category = request_data['category']
 
-    repeated_question = Question.query.filter(Question.question == question).one_or_none()
-
-    if repeated_question is None:
-      try:
-        new_question = Question(
-          question=question,
-          answer=answer,
-          difficulty=difficulty,
-          category=category
-        )
-        new_question.insert()
-      except:
-        abort(500)
-      finally:
-        return jsonify({
-          'success': True
-        })
-    else:
+    try:
+      new_question = Question(
+        question=question,
+        answer=answer,
+        difficulty=difficulty,
+        category=category
+      )
+      new_question.insert()
+    except IntegrityError:
+      # repeated question, rejected by the unique index
+      db.session.rollback()
       abort(422)
+    except:
+      db.session.rollback()
+      abort(500)
+
+    return jsonify({
+      'success': True
+    })
+
+  @app.route('/questions/import', methods=['POST'])
+  def import_questions():
+    """Bulk import questions from a JSONL, or text/csv, request body"""
+    source_format = 'csv' if request.mimetype == 'text/csv' else 'jsonl'
+    rows = bulk.READERS[source_format](bulk.request_lines(request.stream))
+
+    try:
+      report = bulk.import_questions(rows)
+    except (ValueError, csv.Error):
+      db.session.rollback()
+      abort(400)
+
+    return jsonify({
+      'success': True,
+      **report
+    })
+
+  @app.route('/questions/export')
+  def export_questions():
+    """Stream every question as newline-delimited JSON"""
+    return Response(stream_with_context(bulk.export_questions()), mimetype='application/x-ndjson')
 
   @app.route('/questions/search', methods=['POST'])
   def search_questions():
     """Search questions in database with partial string matching"""
-    search_term = request.get_json()['searchTerm']
-    formatted_search_term = f'%{search_term}%'
+    request_data = request.get_json()
+    fields = requested_fields()
 
     try:
-      questions = Question.query.filter(Question.question.ilike(formatted_search_term)).all()
-      formatted_questions = [question.format() for question in questions]
+      search_term = request_data['searchTerm']
+      if not isinstance(search_term, str):
+        raise TypeError('searchTerm must be a string')
+      category = request_data.get('category')
+      category = int(category) if category else None
+      difficulty = request_data.get('difficulty')
+      difficulty = int(difficulty) if difficulty else None
+      page = max(int(request_data.get('page', 1)), 1)
+      per_page = min(max(int(request_data.get('per_page', QUESTIONS_PER_PAGE)), 1), SEARCH_MAX_PER_PAGE)
+    except (KeyError, TypeError, ValueError):
+      abort(400)
 
-      total_questions = len(formatted_questions)
-    except:
-      abort(500)
-    finally:
-      return jsonify({
-        'success': True,
-        'questions': formatted_questions,
-        'total_questions': total_questions,
-        'current_category': None
-      })
+    query, rank = question_search(search_term, category=category, difficulty=difficulty)
+    total_questions = query.with_entities(func.count(Question.id)).scalar()
+
+    questions = query.order_by(rank.desc(), Question.id
+      ).limit(per_page
+      ).offset((page - 1) * per_page
+      ).yield_per(per_page)
+
+    # the page is serialized question by question as it is read
+    return Response(stream_with_context(stream_json({
+      'success': True,
+      'total_questions': total_questions,
+      'current_category': None,
+      'page': page,
+      'has_next': page * per_page < total_questions
+    }, 'questions', (question.format(fields) for question in questions))), mimetype='application/json')
 
   @app.route('/categories/<int:category_id>/questions')
   def get_categorized_questions(category_id):
     """GET questions of a certain category"""
-    category = Category.query.get(category_id)
+    category_type = categories.get().get(category_id)
     
-    if category is None:
+    if category_type is None:
       abort(404)
-    else:
-      try:
-        questions = Question.query.filter(Question.category == category.id)
-        formatted_questions = [question.format() for question in questions]
 
-        total_questions = len(formatted_questions)
-      except:
-        abort(500)
-      finally:
-        return jsonify({
-          'success': True,
-          'questions': formatted_questions,
-          'total_questions': total_questions,
-          'current_category': {category.id: category.type}
-        })
+    fields = requested_fields()
+    include = included(('total_questions', 'current_category'))
+    try:
+      questions = Question.query.filter(Question.category == category_id)
+      formatted_questions = [question.format(fields) for question in questions]
+    except:
+      abort(500)
+
+    data = {
+      'success': True,
+      'questions': formatted_questions
+    }
+    if 'total_questions' in include:
+      data['total_questions'] = len(formatted_questions)
+    if 'current_category' in include:
+      data['current_category'] = {category_id: category_type}
+    return json_response(data)
 
   @app.route('/quizzes', methods=['POST'])
   def get_quiz_question():
@@ -154,21 +247,15 @@ def create_app(test_config=None):
     
     previous_questions = request.get_json()['previous_questions']
     quiz_category = request.get_json()['quiz_category']
+    fields = requested_fields()
 
     try:
+      random_question = sampler.pick(int(quiz_category['id']), previous_questions)
 
-      if quiz_category['id'] != 0:
-        new_questions = Question.query.filter(Question.category == quiz_category['id']).filter(~Question.id.in_(previous_questions))
-      else:
-        new_questions = Question.query.filter(~Question.id.in_(previous_questions))
-      
-      formatted_questions = [question.format() for question in new_questions]
-
-      if (len(formatted_questions) > 0):
-        random_question = random.choice(formatted_questions)
-        return jsonify({
+      if random_question is not None:
+        return json_response({
           'success': True,
-          'question': random_question
+          'question': random_question.format(fields)
         })
       else:
         return jsonify({
@@ -177,6 +264,58 @@ def create_app(test_config=None):
     except:
       abort(500)
 
+  @app.route('/quizzes/sessions', methods=['POST'])
+  def start_quiz_session():
+    """Start a quiz within a category and return its session token"""
+    try:
+      category_id = int(request.get_json()['quiz_category']['id'])
+    except (KeyError, TypeError, ValueError):
+      abort(400)
+
+    if category_id != ALL_CATEGORIES and category_id not in categories.get():
+      abort(404)
+
+    question_ids = sampler.question_ids(category_id) or ()
+    token = quiz_sessions.start(question_ids)
+
+    return jsonify({
+      'success': True,
+      'session': token,
+      'total_questions': len(question_ids)
+    })
+
+  @app.route('/quizzes/sessions/<token>/next', methods=['POST'])
+  def get_next_session_question(token):
+    """Deal the next question of a quiz session"""
+    fields = requested_fields()
+    question = None
+    while question is None:
+      try:
+        question_id, remaining = quiz_sessions.deal(token)
+      except KeyError:
+        abort(404)
+      if question_id is None:
+        return jsonify({
+          'success': True,
+          'remaining_questions': 0
+        })
+      # skip questions deleted since the session started
+      question = Question.query.get(question_id)
+
+    return json_response({
+      'success': True,
+      'question': question.format(fields),
+      'remaining_questions': remaining
+    })
+
+  @app.route('/quizzes/sessions/<token>', methods=['DELETE'])
+  def end_quiz_session(token):
+    """End a quiz session before its deck is exhausted"""
+    quiz_sessions.end(token)
+    return jsonify({
+      'success': True
+    })
+
   @app.errorhandler(400)
   def bad_request(error):
     """Handle a bad request"""
@@ -0,0 +1,132 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Question, Category
+from .cache import stamp_for
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+
+
+def read_jsonl(lines):
+  """Yield one question dict per non-blank JSON line"""
+  for line in lines:
+    if line.strip():
+      yield json.loads(line)
+
+def read_csv(lines):
+  """Yield one question dict per CSV row, the first row naming the columns"""
+  yield from csv.DictReader(lines)
+
+READERS = {
+  'jsonl': read_jsonl,
+  'csv': read_csv
+}
+
+def clean_question(row, category_ids):
+  """Return `row` as a questions table row, or None if it is not a valid question"""
+  try:
+    question = {
+      'question': row['question'].strip(),
+      'answer': row['answer'].strip(),
+      'difficulty': int(row['difficulty']),
+      'category': int(row['category'])
+    }
+  except (KeyError, TypeError, ValueError, AttributeError):
+    return None
+  if not question['question'] or not question['answer'] or question['category'] not in category_ids:
+    return None
+  return question
+
+
+def import_questions(rows, batch_size=IMPORT_BATCH_SIZE):
+  """Insert question dicts from `rows` in batches and report what happened.
+
+  Each batch is one executemany of INSERT ... ON CONFLICT DO NOTHING, so
+  questions already in the database (or repeated in the input) are skipped
+  by the unique index on md5(questions.question), without looking them up.
+  """
+  started = time.perf_counter()
+  category_ids = {category_id for category_id, in db.session.query(Category.id)}
+  statement = insert(Question.__table__).on_conflict_do_nothing(
+    index_elements=[func.md5(Question.__table__.c.question)])
+  report = {'read': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0}
+
+  rows = iter(rows)
+  try:
+    while True:
+      batch = list(islice(rows, batch_size))
+      if not batch:
+        break
+      report['read'] += len(batch)
+
+      questions = []
+      for row in batch:
+        question = clean_question(row, category_ids)
+        if question is None:
+          report['invalid'] += 1
+        else:
+          questions.append(question)
+
+      if questions:
+        inserted = db.session.execute(statement, questions).rowcount
+        db.session.commit()
+        report['inserted'] += inserted
+        report['duplicates'] += len(questions) - inserted
+  finally:
+    if report['inserted']:
+      # the inserts bypassed the ORM, so caches must be told explicitly
+      stamp_for(Question).bump()
+
+  report['seconds'] = round(time.perf_counter() - started, 3)
+  report['rows_per_second'] = round(report['read'] / report['seconds']) if report['seconds'] else None
+  return report
+
+
+def export_questions(batch_size=EXPORT_BATCH_SIZE):
+  """Yield every question as one NDJSON line, reading `batch_size` rows at a time"""
+  rows = db.session.query(
+    Question.id, Question.question, Question.answer, Question.difficulty, Question.category
+  ).order_by(Question.id).yield_per(batch_size)
+  for row in rows:
+    yield json.dumps(row._asdict()) + '\n'
+
+
+@click.command('import-questions')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'source_format', type=click.Choice(sorted(READERS)),
+  help='Input format, guessed from the file extension by default.')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+@with_appcontext
+def import_questions_command(source, source_format, batch_size):
+  """Import questions from a JSONL or CSV file ('-' for stdin)."""
+  if source_format is None:
+    source_format = 'csv' if source.name.endswith('.csv') else 'jsonl'
+  try:
+    report = import_questions(READERS[source_format](source), batch_size)
+  except (ValueError, csv.Error) as error:
+    raise click.ClickException(f'Could not read {source.name}: {error}')
+  click.echo(
+    f'{report["read"]} read, {report["inserted"]} inserted, '
+    f'{report["duplicates"]} duplicates, {report["invalid"]} invalid '
+    f'in {report["seconds"]}s ({report["rows_per_second"]} rows/s)')
+
+@click.command('export-questions')
+@click.argument('target', type=click.File('w', encoding='utf-8'), default='-')
+@with_appcontext
+def export_questions_command(target):
+  """Export every question as NDJSON to a file (stdout by default)."""
+  for line in export_questions():
+    target.write(line)
+
+def request_lines(stream, encoding='utf-8'):
+  """Decode a binary request body line by line"""
+  return io.TextIOWrapper(stream, encoding=encoding, newline='')
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import time
+from itertools import chain
+from threading import Lock
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+'''
+Version stamps
+    One stamp per table, bumped after every commit that wrote to the table.
+    By default a stamp is a counter local to the process; after
+    share_versions(directory) it is a file whose identity changes on every
+    bump, so all workers pointed at the same directory see each other's
+    writes with a single stat() call.
+'''
+class VersionStamp:
+
+  def __init__(self, name, directory=None):
+    self.name = name
+    self.counter = 0
+    self.path = None
+    if directory is not None:
+      self.share(directory)
+
+  def share(self, directory):
+    os.makedirs(directory, exist_ok=True)
+    self.path = os.path.join(directory, f'{self.name}.version')
+    if not os.path.exists(self.path):
+      self.bump()
+
+  @property
+  def shared(self):
+    return self.path is not None
+
+  def current(self):
+    if self.path is None:
+      return self.counter
+    try:
+      stat = os.stat(self.path)
+    except FileNotFoundError:
+      return None
+    return (stat.st_ino, stat.st_mtime_ns)
+
+  def bump(self):
+    self.counter += 1
+    if self.path is not None:
+      directory = os.path.dirname(self.path)
+      fd, tmp_path = tempfile.mkstemp(dir=directory)
+      with os.fdopen(fd, 'w') as f:
+        f.write(str(self.counter))
+      os.replace(tmp_path, self.path)
+
+
+_stamps = {}
+_shared_directory = None
+
+def stamp_for(model):
+  """The process-wide version stamp of `model`'s table"""
+  name = model.__tablename__
+  if name not in _stamps:
+    _stamps[name] = VersionStamp(name, _shared_directory)
+  return _stamps[name]
+
+def invalidate_all():
+  """Bump every version stamp, e.g. after rolling back writes that were committed to the session"""
+  for stamp in _stamps.values():
+    stamp.bump()
+
+def share_versions(directory):
+  """Share every version stamp with other processes through `directory`"""
+  global _shared_directory
+  _shared_directory = directory
+  for stamp in _stamps.values():
+    stamp.share(directory)
+
+'''
+Commit tracking
+    Tables written through the ORM are collected at flush time and their
+    stamps bumped once the transaction commits. Bulk query.update() and
+    query.delete() bypass the flush, so callers invalidate those explicitly.
+'''
+@event.listens_for(Session, 'after_flush')
+def _collect_written_tables(session, flush_context):
+  written = session.info.setdefault('written_tables', set())
+  for instance in chain(session.new, session.dirty, session.deleted):
+    written.add(instance.__tablename__)
+
+@event.listens_for(Session, 'after_commit')
+def _bump_written_tables(session):
+  for name in session.info.pop('written_tables', ()):
+    if name in _stamps:
+      _stamps[name].bump()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_written_tables(session):
+  session.info.pop('written_tables', None)
+
+
+class VersionedCache:
+  """A lazily loaded value, reloaded whenever its version stamp changes.
+
+  A stamp local to the process cannot see commits made by other workers,
+  so unless versions are shared the value is also reloaded once it is
+  older than `ttl` seconds, which bounds how stale it can get.
+  """
+
+  def __init__(self, loader, stamp, ttl=None):
+    self.loader = loader
+    self.stamp = stamp
+    self.ttl = ttl
+    self.lock = Lock()
+    self.value = None
+    self.version = None
+    self.loaded_at = None
+
+  def get(self):
+    version = self.stamp.current()
+    now = time.monotonic()
+    with self.lock:
+      if self.loaded_at is None or version != self.version or self._expired(now):
+        self.value = self.loader()
+        self.version = version
+        self.loaded_at = now
+      return self.value
+
+  def _expired(self, now):
+    return self.ttl is not None and not self.stamp.shared and now - self.loaded_at >= self.ttl
+
+  def invalidate(self):
+    self.stamp.bump()
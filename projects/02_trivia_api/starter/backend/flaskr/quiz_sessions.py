@@ -0,0 +1,102 @@
+import random
+import secrets
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class QuizSession:
+  """A lazily shuffled deck over an array of question ids.
+
+  The session keeps a reference to the (shared, never modified) id array
+  and deals it in a random order with a sparse Fisher-Yates shuffle: only
+  the positions swapped so far are stored, so a session costs memory in
+  proportion to the questions dealt, not to the size of the deck.
+  """
+
+  __slots__ = ('ids', 'position', 'swaps', 'expires')
+
+  def __init__(self, question_ids, expires):
+    self.ids = question_ids
+    self.position = 0
+    self.swaps = {}
+    self.expires = expires
+
+  def deal(self):
+    """Return the next question id, or None once the deck is exhausted"""
+    size = len(self.ids)
+    if self.position >= size:
+      return None
+    i = self.position
+    j = random.randrange(i, size)
+    # position i is never read again: j takes over what i held
+    held = self.swaps.pop(i, i)
+    if j == i:
+      picked = held
+    else:
+      picked = self.swaps.get(j, j)
+      self.swaps[j] = held
+    self.position += 1
+    return self.ids[picked]
+
+  def __len__(self):
+    return len(self.ids) - self.position
+
+
+class QuizSessions:
+  """Quiz sessions kept in memory, keyed by an unguessable token.
+
+  Sessions are ordered by last use, so expired ones are always found at the
+  front and evicted there; past `max_sessions` the least recently used
+  session is dropped as well.
+  """
+
+  def __init__(self, ttl=3600, max_sessions=10000):
+    self.ttl = ttl
+    self.max_sessions = max_sessions
+    self.sessions = OrderedDict()
+    self.lock = Lock()
+
+  def start(self, question_ids):
+    """Start a session over `question_ids` and return its token.
+
+    The session reads `question_ids` as it deals, so the array must not be
+    modified afterwards.
+    """
+    token = secrets.token_urlsafe(16)
+    session = QuizSession(question_ids, time.monotonic() + self.ttl)
+    with self.lock:
+      self._evict()
+      self.sessions[token] = session
+      while len(self.sessions) > self.max_sessions:
+        self.sessions.popitem(last=False)
+    return token
+
+  def deal(self, token):
+    """Return the next question id of the session and how many remain after it.
+
+    The id is None once the deck is exhausted. Raises KeyError for an
+    unknown or expired token.
+    """
+    with self.lock:
+      self._evict()
+      session = self.sessions[token]
+      session.expires = time.monotonic() + self.ttl
+      self.sessions.move_to_end(token)
+      question_id = session.deal()
+      return question_id, len(session)
+
+  def end(self, token):
+    with self.lock:
+      self.sessions.pop(token, None)
+
+  def __len__(self):
+    return len(self.sessions)
+
+  def _evict(self):
+    now = time.monotonic()
+    while self.sessions:
+      token, session = next(iter(self.sessions.items()))
+      if session.expires > now:
+        break
+      del self.sessions[token]
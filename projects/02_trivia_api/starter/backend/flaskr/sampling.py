@@ -0,0 +1,65 @@
+import random
+from array import array
+
+from models import db, Question
+from .cache import VersionedCache, stamp_for
+
+ALL_CATEGORIES = 0
+# random draws tried before falling back to listing the remaining ids
+MAX_REJECTIONS = 16
+
+
+def load_question_ids():
+  """Map each category id, and ALL_CATEGORIES, to an array of its question ids"""
+  ids = {ALL_CATEGORIES: array('i')}
+  rows = db.session.query(Question.category, Question.id).order_by(Question.id)
+  for category, question_id in rows:
+    if category is not None:
+      ids.setdefault(category, array('i')).append(question_id)
+    ids[ALL_CATEGORIES].append(question_id)
+  return ids
+
+
+class QuestionSampler:
+  """Pick random quiz questions without loading the candidate questions.
+
+  Question ids are kept in one compact array per category, reloaded only
+  after the questions table is written. A pick draws random positions and
+  rejects already played ids, so it costs a few set lookups and a single
+  primary key fetch whatever the size of the category.
+  """
+
+  def __init__(self, ttl=None):
+    self.ids = VersionedCache(load_question_ids, stamp_for(Question), ttl)
+
+  def question_ids(self, category_id):
+    """Return the array of question ids of `category_id`, or None if it has none"""
+    return self.ids.get().get(category_id)
+
+  def pick_id(self, category_id, previous_questions):
+    """Return a random id of `category_id` not in `previous_questions`, or None"""
+    ids = self.question_ids(category_id)
+    if not ids:
+      return None
+
+    for _ in range(MAX_REJECTIONS):
+      question_id = ids[random.randrange(len(ids))]
+      if question_id not in previous_questions:
+        return question_id
+
+    # most of the category has been played: pick among what is left
+    remaining = [question_id for question_id in ids if question_id not in previous_questions]
+    return random.choice(remaining) if remaining else None
+
+  def pick(self, category_id, previous_questions):
+    """Return a random unplayed Question of `category_id`, or None"""
+    previous_questions = set(previous_questions)
+    while True:
+      question_id = self.pick_id(category_id, previous_questions)
+      if question_id is None:
+        return None
+      question = Question.query.get(question_id)
+      if question is not None:
+        return question
+      # deleted by a transaction the cached ids have not caught up with
+      previous_questions.add(question_id)
@@ -0,0 +1,41 @@
+from sqlalchemy import func, or_
+
+from models import Question
+from .serialization import dumps
+
+
+def escape_like(search_term):
+  return search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def question_search(search_term, category=None, difficulty=None):
+  """Return the questions matching `search_term` and their relevance rank.
+
+  A question matches when its question or answer contains the term, which
+  the trigram indexes on both columns serve. Matches are ranked by
+  full-text relevance, question text weighing more than the answer.
+  """
+  pattern = f'%{escape_like(search_term)}%'
+  query = Question.query.filter(or_(
+    Question.question.ilike(pattern, escape='\\'),
+    Question.answer.ilike(pattern, escape='\\')
+  ))
+  if category is not None:
+    query = query.filter(Question.category == category)
+  if difficulty is not None:
+    query = query.filter(Question.difficulty == difficulty)
+
+  document = func.setweight(
+    func.to_tsvector('english', func.coalesce(Question.question, '')), 'A'
+  ).op('||')(func.setweight(
+    func.to_tsvector('english', func.coalesce(Question.answer, '')), 'B'
+  ))
+  rank = func.ts_rank(document, func.plainto_tsquery('english', search_term))
+  return query, rank
+
+def stream_json(fields, list_key, items):
+  """Yield the JSON object `fields` with `list_key` added, one list item at a time"""
+  head = dumps(fields)
+  yield head[:-1] + b',' + dumps(list_key) + b':['
+  for i, item in enumerate(items):
+    yield (b',' if i else b'') + dumps(item)
+  yield b']}'
@@ -0,0 +1,79 @@
+import gzip
+import json
+
+from flask import Response, request, abort
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+# responses smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 500
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson'}
+
+
+def dumps(value):
+  """Serialize `value` to compact JSON bytes, with orjson when it is installed"""
+  if orjson is not None:
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+  return json.dumps(value, separators=(',', ':')).encode()
+
+def json_response(data, status=200, **fragments):
+  """Build a JSON response from `data` plus already serialized values.
+
+  Each keyword argument is added to the object as is, so values shared by
+  many responses (like the categories) are serialized once, not per request.
+  """
+  body = dumps(data)
+  for key, fragment in fragments.items():
+    separator = b',' if body != b'{}' else b''
+    body = body[:-1] + separator + dumps(key) + b':' + fragment + b'}'
+  return Response(body, status=status, mimetype='application/json')
+
+
+def requested_fields(fields=QUESTION_FIELDS):
+  """Return the question fields listed in `?fields=`, or None for all of them"""
+  requested = request.args.get('fields')
+  if requested is None:
+    return None
+  requested = tuple(field.strip() for field in requested.split(',') if field.strip())
+  if not requested or any(field not in fields for field in requested):
+    abort(400)
+  return requested
+
+def included(optional):
+  """Return the optional response keys to send: those listed in `?include=`, or all"""
+  requested = request.args.get('include')
+  if requested is None:
+    return set(optional)
+  return {key.strip() for key in requested.split(',')} & set(optional)
+
+
+def compress_response(response):
+  """Compress a JSON response with brotli or gzip, as the client accepts"""
+  if (response.status_code < 200 or response.status_code >= 300
+      or response.is_streamed or response.direct_passthrough
+      or response.mimetype not in COMPRESSIBLE_MIMETYPES
+      or 'Content-Encoding' in response.headers):
+    return response
+
+  response.vary.add('Accept-Encoding')
+  body = response.get_data()
+  if len(body) < COMPRESS_MIN_SIZE:
+    return response
+
+  accepted = request.accept_encodings
+  if brotli is not None and accepted['br'] and accepted['br'] >= accepted['gzip']:
+    response.set_data(brotli.compress(body, quality=5))
+    response.headers['Content-Encoding'] = 'br'
+  elif accepted['gzip']:
+    response.set_data(gzip.compress(body, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+  return response
@@ -0,0 +1,39 @@
+"""baseline schema from trivia.psql
+
+Revision ID: 2b9d6e0c7a14
+Revises: 
+Create Date: 2026-10-18 14:03:27.518062
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b9d6e0c7a14'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('categories',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('type', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id', name='categories_pkey')
+    )
+    op.create_table('questions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('question', sa.Text(), nullable=True),
+    sa.Column('answer', sa.Text(), nullable=True),
+    sa.Column('difficulty', sa.Integer(), nullable=True),
+    sa.Column('category', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['category'], ['categories.id'], name='category',
+        onupdate='CASCADE', ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id', name='questions_pkey')
+    )
+
+
+def downgrade():
+    op.drop_table('questions')
+    op.drop_table('categories')
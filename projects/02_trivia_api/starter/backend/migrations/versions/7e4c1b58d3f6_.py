@@ -0,0 +1,39 @@
+"""trigram indexes for question search
+
+Revision ID: 7e4c1b58d3f6
+Revises: 2b9d6e0c7a14
+Create Date: 2026-10-18 14:21:09.837140
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e4c1b58d3f6'
+down_revision = '2b9d6e0c7a14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_questions_question_trgm', 'questions', ['question'],
+            postgresql_using='gin',
+            postgresql_ops={'question': 'gin_trgm_ops'},
+            postgresql_concurrently=True)
+        op.create_index('ix_questions_answer_trgm', 'questions', ['answer'],
+            postgresql_using='gin',
+            postgresql_ops={'answer': 'gin_trgm_ops'},
+            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_questions_answer_trgm', table_name='questions',
+            postgresql_concurrently=True)
+        op.drop_index('ix_questions_question_trgm', table_name='questions',
+            postgresql_concurrently=True)
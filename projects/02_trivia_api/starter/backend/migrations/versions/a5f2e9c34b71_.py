@@ -0,0 +1,71 @@
+"""unique question text for bulk import deduplication
+
+Revision ID: a5f2e9c34b71
+Revises: 7e4c1b58d3f6
+Create Date: 2026-10-18 15:02:44.613920
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5f2e9c34b71'
+down_revision = '7e4c1b58d3f6'
+branch_labels = None
+depends_on = None
+
+
+logger = logging.getLogger('alembic.env')
+
+# questions entered more than once are moved here rather than deleted
+DUPLICATES_TABLE = 'questions_duplicates'
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    # keep the oldest copy of any question entered more than once
+    duplicates = connection.execute('''
+        SELECT count(*) FROM questions AS duplicate
+        WHERE EXISTS (
+            SELECT 1 FROM questions AS original
+            WHERE md5(original.question) = md5(duplicate.question)
+              AND original.id < duplicate.id)
+    ''').scalar()
+    if duplicates:
+        op.execute(f'''
+            CREATE TABLE {DUPLICATES_TABLE} (LIKE questions);
+            INSERT INTO {DUPLICATES_TABLE}
+            SELECT duplicate.* FROM questions AS duplicate
+            WHERE EXISTS (
+                SELECT 1 FROM questions AS original
+                WHERE md5(original.question) = md5(duplicate.question)
+                  AND original.id < duplicate.id);
+            DELETE FROM questions WHERE id IN (SELECT id FROM {DUPLICATES_TABLE});
+        ''')
+        logger.warning('Moved %d duplicate questions to %s; downgrading restores them.',
+            duplicates, DUPLICATES_TABLE)
+
+    # question text is unbounded and btree entries are limited to about
+    # 2.7 kB, so uniqueness is enforced on its md5 digest.
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    with op.get_context().autocommit_block():
+        op.execute('''
+            CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_questions_question_md5
+            ON questions (md5(question))
+        ''')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('uq_questions_question_md5', table_name='questions',
+            postgresql_concurrently=True)
+
+    if DUPLICATES_TABLE in sa.inspect(op.get_bind()).get_table_names():
+        op.execute(f'''
+            INSERT INTO questions SELECT * FROM {DUPLICATES_TABLE};
+            DROP TABLE {DUPLICATES_TABLE};
+        ''')
@@ -0,0 +1,67 @@
+"""integer category foreign key and category indexes on questions
+
+The type and foreign key changes only apply to databases bootstrapped with
+db.create_all() from the old model, whose category column was text; the
+schema of the previous revisions (2b9d6e0c7a14) already has them. They are
+not reversed by downgrade(), which cannot tell which kind of database it
+runs on, and categories that were not a valid category id are set to NULL
+(the number of such questions is logged).
+
+Revision ID: d81f4a7c2e90
+Revises: a5f2e9c34b71
+Create Date: 2026-10-18 15:48:12.057331
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f4a7c2e90'
+down_revision = 'a5f2e9c34b71'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.env')
+
+
+def upgrade():
+    # databases bootstrapped with db.create_all() from the old model have a
+    # text category column without a foreign key
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    columns = {column['name']: column for column in inspector.get_columns('questions')}
+    if not isinstance(columns['category']['type'], sa.Integer):
+        nulled = connection.execute(
+            "UPDATE questions SET category = NULL WHERE category !~ '^[0-9]+$'").rowcount
+        if nulled:
+            logger.warning('Set the non-numeric category of %d questions to NULL.', nulled)
+        op.alter_column('questions', 'category',
+            type_=sa.Integer(),
+            postgresql_using='category::integer')
+    if not any(fk['referred_table'] == 'categories' for fk in inspector.get_foreign_keys('questions')):
+        nulled = connection.execute('''
+            UPDATE questions SET category = NULL
+            WHERE category NOT IN (SELECT id FROM categories)
+        ''').rowcount
+        if nulled:
+            logger.warning('Set the unknown category of %d questions to NULL.', nulled)
+        op.create_foreign_key('category', 'questions', 'categories', ['category'], ['id'],
+            onupdate='CASCADE', ondelete='SET NULL')
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction. The
+    # composite index also serves lookups by category alone.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_questions_category_difficulty', 'questions', ['category', 'difficulty'],
+            postgresql_concurrently=True)
+
+
+def downgrade():
+    # only the index is dropped: the integer type and foreign key belong to
+    # the previous revisions' schema too, and the categories set to NULL
+    # cannot be recovered (see the module docstring)
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_questions_category_difficulty', table_name='questions',
+            postgresql_concurrently=True)
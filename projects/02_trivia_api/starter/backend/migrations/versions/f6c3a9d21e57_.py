@@ -0,0 +1,34 @@
+"""question uniqueness on md5(question) for databases that ran the btree index
+
+Revision ID: f6c3a9d21e57
+Revises: d81f4a7c2e90
+Create Date: 2026-10-18 19:21:37.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c3a9d21e57'
+down_revision = 'd81f4a7c2e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a5f2e9c34b71 used to build a plain unique index on the question text,
+    # which rejects questions longer than about 2.7 kB; the md5 index is
+    # built before the old one goes, so uniqueness holds throughout
+    with op.get_context().autocommit_block():
+        op.execute('''
+            CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_questions_question_md5
+            ON questions (md5(question))
+        ''')
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS uq_questions_question')
+
+
+def downgrade():
+    # a5f2e9c34b71 now creates the md5 index itself, so there is nothing to
+    # restore: bringing back the btree index would reintroduce the size limit
+    pass
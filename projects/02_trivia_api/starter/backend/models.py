@@ -1,12 +1,18 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import hashlib
+from sqlalchemy import Column, String, Integer, ForeignKey, MetaData, Table, create_engine, DDL, event, func
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.schema import CreateTable, CreateIndex
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
 import json
 
 database_name = "trivia"
-database_path = "postgres://{}/{}".format('localhost:5432', database_name)
+database_path = os.environ.get("DATABASE_URL", "postgres://{}/{}".format('localhost:5432', database_name))
+schema_bootstrap = os.environ.get("SCHEMA_BOOTSTRAP", "auto")
 
 db = SQLAlchemy()
+migrate = Migrate()
 
 '''
 setup_db(app)
@@ -17,7 +23,67 @@ def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
-    db.create_all()
+    migrate.init_app(app, db, include_object=include_object)
+    bootstrap_schema(app.config.get("SCHEMA_BOOTSTRAP", schema_bootstrap))
+
+'''
+bootstrap_schema(mode)
+    creates the tables missing from the database, depending on `mode`:
+    "create_all" checks every table each time an app is set up,
+    "migrations" leaves the schema to `flask db upgrade`,
+    "auto" runs create_all only when the models changed since the
+    fingerprint stored in the schema_stamp table, which costs one query
+    per process and database
+'''
+schema_stamp = Table('schema_stamp', MetaData(), Column('fingerprint', String, primary_key=True))
+bootstrapped = set()
+
+'''
+include_object(object, name, type_, reflected, compare_to)
+    keeps schema_stamp and the questions_duplicates archive of migration
+    a5f2e9c34b71 out of migration autogenerate: they live outside the
+    models' metadata, so alembic would otherwise emit a drop_table for them
+'''
+unmanaged_tables = {schema_stamp.name, "questions_duplicates"}
+
+def include_object(object, name, type_, reflected, compare_to):
+    return not (type_ == "table" and name in unmanaged_tables)
+
+def schema_fingerprint(dialect):
+    statements = []
+    for table in db.metadata.sorted_tables:
+        statements.append(str(CreateTable(table).compile(dialect=dialect)))
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            statements.append(str(CreateIndex(index).compile(dialect=dialect)))
+    return hashlib.sha256('\n'.join(statements).encode()).hexdigest()
+
+def bootstrap_schema(mode="auto"):
+    if mode == "migrations":
+        return
+    if mode == "create_all":
+        db.create_all()
+        return
+    if mode != "auto":
+        raise ValueError("Unknown SCHEMA_BOOTSTRAP mode: {}".format(mode))
+
+    engine = db.get_engine()
+    fingerprint = schema_fingerprint(engine.dialect)
+    if (str(engine.url), fingerprint) in bootstrapped:
+        return
+
+    with engine.connect() as connection:
+        try:
+            stamped = connection.execute(schema_stamp.select()).scalar()
+        except ProgrammingError:
+            stamped = None
+
+    if stamped != fingerprint:
+        db.create_all()
+        with engine.begin() as connection:
+            schema_stamp.create(connection, checkfirst=True)
+            connection.execute(schema_stamp.delete())
+            connection.execute(schema_stamp.insert().values(fingerprint=fingerprint))
+    bootstrapped.add((str(engine.url), fingerprint))
 
 '''
 Question
@@ -29,9 +95,19 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', name='category', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
+  __table_args__ = (
+    db.Index('ix_questions_question_trgm', 'question',
+      postgresql_using='gin', postgresql_ops={'question': 'gin_trgm_ops'}),
+    db.Index('ix_questions_answer_trgm', 'answer',
+      postgresql_using='gin', postgresql_ops={'answer': 'gin_trgm_ops'}),
+    # on the digest: btree entries are limited to about 2.7 kB, questions are not
+    db.Index('uq_questions_question_md5', func.md5(question), unique=True),
+    db.Index('ix_questions_category_difficulty', 'category', 'difficulty'),
+  )
+
   def __init__(self, question, answer, category, difficulty):
     self.question = question
     self.answer = answer
@@ -49,14 +125,20 @@ class Question(db.Model):
     db.session.delete(self)
     db.session.commit()
 
-  def format(self):
-    return {
+  def format(self, fields=None):
+    formatted = {
       'id': self.id,
       'question': self.question,
       'answer': self.answer,
       'category': self.category,
       'difficulty': self.difficulty
     }
+    if fields is None:
+      return formatted
+    return {field: formatted[field] for field in fields}
+
+# the question search indexes need pg_trgm's operator classes
+event.listen(Question.__table__, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
 
 '''
 Category
@@ -71,6 +153,17 @@ class Category(db.Model):
   def __init__(self, type):
     self.type = type
 
+  def insert(self):
+    db.session.add(self)
+    db.session.commit()
+
+  def update(self):
+    db.session.commit()
+
+  def delete(self):
+    db.session.delete(self)
+    db.session.commit()
+
   def format(self):
     return {
       'id': self.id,
@@ -1,22 +1,105 @@
 import os
+import re
+import sys
+import io
+import gzip
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+from flask import _app_ctx_stack
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event, orm
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.cache import invalidate_all
+from models import db, Question, Category
+
+DATABASE_PATH = os.environ.get('TEST_DATABASE_URL', "postgres://{}/{}".format('localhost:5432', 'trivia_test'))
+SEED_DUMP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trivia.psql')
+# endpoints slower than this on average are flagged in the timing report
+SLOW_ENDPOINT_MS = float(os.environ.get('TEST_SLOW_ENDPOINT_MS', 50))
+
+"""
+Hermetic test mode
+
+The app is created once. The schema is created and seeded from trivia.psql
+inside one transaction that is rolled back when the module finishes, and
+every test runs inside a savepoint of that transaction that is rolled back
+after it. The app's own commits only release inner savepoints, so nothing
+a test writes survives it and the database is left as it was found.
+"""
+class SavepointSession(SignallingSession):
+    """A session whose transactions are savepoints of the test's transaction"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.begin_nested()
+
+@event.listens_for(SavepointSession, 'after_transaction_end')
+def restart_savepoint(session, transaction):
+    if transaction.nested and not transaction._parent.nested:
+        session.expire_all()
+        session.begin_nested()
+
+def seed(connection, dump_path=SEED_DUMP):
+    """Replace the contents of the tables with the data of a pg_dump file"""
+    with open(dump_path) as f:
+        dump = f.read()
+    cursor = connection.connection.cursor()
+    cursor.execute('TRUNCATE questions, categories RESTART IDENTITY CASCADE')
+    for table, columns, rows in re.findall(r'^COPY (\S+) \(([^)]*)\) FROM stdin;\n(.*?)^\\\.$', dump, re.M | re.S):
+        cursor.copy_expert(f'COPY {table} ({columns}) FROM STDIN', io.StringIO(rows))
+    for setval in re.findall(r'^SELECT pg_catalog\.setval\(.*\);$', dump, re.M):
+        cursor.execute(setval)
+
+app = None
+connection = None
+transaction = None
+app_session = None
+
+def setUpModule():
+    global app, connection, transaction, app_session
+    app = create_app({
+        'DATABASE_PATH': DATABASE_PATH,
+        # the schema is created below, inside the rolled-back transaction
+        'SCHEMA_BOOTSTRAP': 'migrations',
+        'SQL_INSTRUMENTATION_HEADERS': True
+    })
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    db.metadata.create_all(bind=connection)
+    seed(connection)
+
+    app_session = db.session
+    db.session = orm.scoped_session(
+        orm.sessionmaker(class_=SavepointSession, db=db, bind=connection, binds={}, query_cls=db.Query),
+        scopefunc=_app_ctx_stack.__ident_func__
+    )
+
+def tearDownModule():
+    db.session.remove()
+    db.session = app_session
+    transaction.rollback()
+    connection.close()
+    report_timings(app.test_client())
+
+def report_timings(client, stream=sys.stderr):
+    """Print the mean latency of every endpoint the tests called, flagging slow ones"""
+    routes = json.loads(client.get('/metrics').data)['routes']
+    print('\nEndpoint timings (mean / max ms, queries per request):', file=stream)
+    for route, metrics in sorted(routes.items(), key=lambda item: -item[1]['latency_ms']['mean']):
+        latency = metrics['latency_ms']
+        flag = 'SLOW' if latency['mean'] > SLOW_ENDPOINT_MS else '    '
+        print(f'  {flag} {latency["mean"]:8.1f} {latency["max"]:8.1f} {metrics["queries_per_request"]:6.1f}  {route}', file=stream)
 
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
+        """Define test variables and start the test's savepoint."""
+        self.app = app
         self.client = self.app.test_client
-        self.database_name = "trivia_test"
-        self.database_path = "postgres://{}/{}".format('localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+        self.savepoint = connection.begin_nested()
 
         self.new_question = {
             'question': 'Who invented the telegraph?',
@@ -24,17 +107,13 @@ class TriviaTestCase(unittest.TestCase):
             'difficulty': 3,
             'category': 1
         }
-
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
     
     def tearDown(self):
-        """Executed after reach test"""
-        pass
+        """Roll back everything the test wrote"""
+        db.session.remove()
+        self.savepoint.rollback()
+        # cached values may have been loaded from rows that no longer exist
+        invalidate_all()
 
     """
     TODO
@@ -52,6 +131,32 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['categories'])
     
+    def test_category_cache_reloads_after_write(self):
+        """Test cached categories are served again only until a category is written"""
+        first = self.client().get('/categories')
+        second = self.client().get('/categories')
+        self.assertGreaterEqual(int(first.headers['X-SQL-Queries']), 1)
+        self.assertEqual(second.headers['X-SQL-Queries'], '0')
+
+        category = Category(type='Music')
+        category.insert()
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+        category.delete()
+
+        self.assertEqual(data['categories'][str(category.id)], 'Music')
+        self.assertNotIn(str(category.id), json.loads(self.client().get('/categories').data)['categories'])
+
+    def test_get_category_question_counts(self):
+        """Test counting the questions of every category"""
+        res = self.client().get('/categories/question-counts')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['counts']), Category.query.count())
+        self.assertEqual(sum(data['counts'].values()), Question.query.filter(Question.category != None).count())
+        self.assertEqual(data['counts']['1'], Question.query.filter(Question.category == 1).count())
+
     def test_404_get_categories(self):
         """Test correct error handling for bad request"""
         res = self.client().get('/category')
@@ -74,6 +179,61 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data['categories']))
         self.assertIsNone(data['current_category'])
     
+    def test_get_questions_page_limited_in_database(self):
+        """Test a page holds at most 10 questions while the total counts all"""
+        res = self.client().get('/questions?page=1')
+        data = json.loads(res.data)
+
+        with self.app.app_context():
+            total = Question.query.count()
+        self.assertEqual(res.status_code, 200)
+        self.assertLessEqual(len(data['questions']), 10)
+        self.assertEqual(data['total_questions'], total)
+
+    def test_get_questions_sparse_fields(self):
+        """Test trimming questions to the requested fields and optional keys"""
+        res = self.client().get('/questions?fields=id,question&include=total_questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(data['questions'][0]), {'id', 'question'})
+        self.assertTrue(data['total_questions'])
+        self.assertNotIn('categories', data)
+        self.assertNotIn('current_category', data)
+
+    def test_400_get_questions_unknown_field(self):
+        """Test requesting a field questions do not have"""
+        res = self.client().get('/questions?fields=id,password')
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_get_questions_gzip(self):
+        """Test responses are compressed when the client accepts gzip"""
+        res = self.client().get('/questions', headers={'Accept-Encoding': 'gzip'})
+        data = json.loads(gzip.decompress(res.data))
+
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(data['questions']), 10)
+        self.assertEqual(data['categories']['1'], 'Science')
+
+    def test_get_questions_after_cursor(self):
+        """Test keyset pagination continues after the given question id"""
+        first = json.loads(self.client().get('/questions').data)
+        res = self.client().get(f'/questions?after={first["next_after"]}')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(all(q['id'] > first['next_after'] for q in data['questions']))
+        self.assertEqual(data['total_questions'], first['total_questions'])
+
+    def test_404_get_questions_page_out_of_range(self):
+        """Test requesting a page past the last question"""
+        res = self.client().get('/questions?page=1000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['message'], 'resource not found')
+
     def test_404_get_paginated_questions(self):
         """Test correct error handling for route"""
         res = self.client().get('/question')
@@ -122,6 +282,56 @@ class TriviaTestCase(unittest.TestCase):
     #     self.assertEqual(res.status_code, 422)
     #     self.assertEqual(data['message'], 'unprocessable')
 
+    '''
+        Bulk import and export
+    '''
+    def test_import_questions_jsonl(self):
+        """Test bulk import skips duplicates and invalid rows"""
+        existing = Question.query.first()
+        new_question = {'question': 'Who wrote Hamlet?', 'answer': 'Shakespeare', 'difficulty': 1, 'category': 4}
+        lines = [
+            json.dumps(new_question),
+            json.dumps(dict(new_question, question='Who wrote Faust?', answer='Goethe')),
+            json.dumps(new_question),
+            json.dumps({'question': existing.question, 'answer': 'x', 'difficulty': 1, 'category': 1}),
+            json.dumps({'question': 'No answer?', 'difficulty': 1, 'category': 1})
+        ]
+        res = self.client().post('/questions/import', data='\n'.join(lines),
+            content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['read'], 5)
+        self.assertEqual(data['inserted'], 2)
+        self.assertEqual(data['duplicates'], 2)
+        self.assertEqual(data['invalid'], 1)
+
+    def test_import_questions_csv(self):
+        """Test bulk import of CSV rows"""
+        body = 'question,answer,difficulty,category\n"Who painted Guernica?",Picasso,2,2\n'
+        res = self.client().post('/questions/import', data=body, content_type='text/csv')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 1)
+        self.assertIsNotNone(Question.query.filter(Question.question == 'Who painted Guernica?').one_or_none())
+
+    def test_400_import_questions_malformed(self):
+        """Test bulk import of a body that is not JSONL"""
+        res = self.client().post('/questions/import', data='{not json', content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_export_questions(self):
+        """Test every question is exported as one JSON line"""
+        res = self.client().get('/questions/export')
+        lines = res.data.decode().splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(lines), Question.query.count())
+        self.assertEqual(set(json.loads(lines[0])), {'id', 'question', 'answer', 'difficulty', 'category'})
+
     '''
         Search questions
     '''
@@ -136,6 +346,46 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertIsNone(data['current_category'])
     
+    def test_search_question_filtered_page(self):
+        """Test searching one page of questions of a category, best match first"""
+        res = self.client().post('/questions/search', json={
+            'searchTerm': 'a',
+            'category': 4,
+            'page': 1,
+            'per_page': 2
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['questions']), 2)
+        self.assertTrue(all(question['category'] == 4 for question in data['questions']))
+        self.assertGreater(data['total_questions'], 2)
+        self.assertEqual(data['has_next'], True)
+
+    def test_400_search_question_bad_page(self):
+        """Test searching with a malformed page number"""
+        res = self.client().post('/questions/search', json={'searchTerm': 'a', 'page': 'first'})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_400_search_question_bad_category(self):
+        """Test searching with a non-numeric category"""
+        res = self.client().post('/questions/search', json={'searchTerm': 'a', 'category': 'abc'})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_400_search_question_bad_difficulty(self):
+        """Test searching with a non-numeric difficulty"""
+        res = self.client().post('/questions/search', json={'searchTerm': 'a', 'difficulty': 'x'})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_400_search_question_null_term(self):
+        """Test searching with a search term that is not a string"""
+        res = self.client().post('/questions/search', json={'searchTerm': None})
+
+        self.assertEqual(res.status_code, 400)
+
     def test_search_question_none_found(self):
         """Test for search term matching no questions in db"""
         res = self.client().post('/questions/search', json={'searchTerm': '$'})
@@ -181,6 +431,78 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['question'])
 
 
+    def test_get_last_unplayed_quiz_question(self):
+        """Test the quiz returns the only unplayed question, then none"""
+        ids = [question.id for question in Question.query.filter(Question.category == 1)]
+        request_data = {
+            'previous_questions': ids[1:],
+            'quiz_category': {'id': '1', 'type': 'Science'}
+        }
+        res = self.client().post('/quizzes', json=request_data)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], ids[0])
+
+        request_data['previous_questions'] = ids
+        data = json.loads(self.client().post('/quizzes', json=request_data).data)
+        self.assertEqual(data['success'], True)
+        self.assertNotIn('question', data)
+
+    def test_quiz_session_deals_each_question_once(self):
+        """Test a quiz session deals every question of its category once"""
+        ids = [question.id for question in Question.query.filter(Question.category == 1)]
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': {'id': 1}})
+        data = json.loads(res.data)
+        token = data['session']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], len(ids))
+
+        dealt = []
+        for remaining in reversed(range(len(ids))):
+            data = json.loads(self.client().post(f'/quizzes/sessions/{token}/next').data)
+            dealt.append(data['question']['id'])
+            self.assertEqual(data['remaining_questions'], remaining)
+        self.assertEqual(sorted(dealt), sorted(ids))
+
+        data = json.loads(self.client().post(f'/quizzes/sessions/{token}/next').data)
+        self.assertEqual(data['success'], True)
+        self.assertNotIn('question', data)
+
+    def test_400_quiz_session_bad_category(self):
+        """Test starting a quiz session with a non-numeric category id"""
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': {'id': 'abc'}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['message'], 'bad request')
+
+    def test_404_quiz_session_not_found(self):
+        """Test dealing from an unknown quiz session"""
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['message'], 'resource not found')
+
+    '''
+        Request metrics
+    '''
+    def test_get_metrics(self):
+        """Test per-route metrics are collected for served requests"""
+        self.client().get('/categories/question-counts')
+        before = json.loads(self.client().get('/metrics').data)['routes']['GET /categories/question-counts']
+        self.client().get('/categories/question-counts')
+        res = self.client().get('/metrics')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['routes']['GET /categories/question-counts']['count'], before['count'] + 1)
+        self.assertGreaterEqual(data['routes']['GET /categories/question-counts']['queries_per_request'], 1)
+
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -4,11 +4,14 @@ from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db_drop_and_create_all, setup_db, db, Drink
 from .auth.auth import AuthError, requires_auth
+from .instrumentation import SQLInstrumentation
+from .response_cache import ResponseCache
 
 app = Flask(__name__)
 setup_db(app)
+SQLInstrumentation(app)
 CORS(app)
 
 '''
@@ -18,61 +21,146 @@ CORS(app)
 '''
 # db_drop_and_create_all()
 
+'''
+Encoded menu responses, served with ETags
+    the POST, PATCH and DELETE handlers invalidate it once their change is committed
+    other worker processes rebuild theirs after MENU_CACHE_MAX_AGE seconds (30 by default)
+'''
+menu = ResponseCache(max_age=int(os.environ.get('MENU_CACHE_MAX_AGE', 30)))
+
+'''
+drink_from_request(drink)
+    sets the title and recipe sent in the request body on drink
+    both are required for a new drink (no id yet)
+    aborts with 400 if the body is not a json object or misses a required field
+'''
+def drink_from_request(drink):
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400)
+    if drink.id is None and not {'title', 'recipe'} <= body.keys():
+        abort(400)
+
+    try:
+        if 'title' in body:
+            drink.title = body['title']
+        if 'recipe' in body:
+            drink.recipe = body['recipe']
+    except ValueError:
+        abort(422)
+    return drink
+
+'''
+save_drink(save)
+    commits a drink change with save(), then drops the cached menu
+    aborts with 422 if the change breaks a constraint (a duplicate title)
+'''
+def save_drink(save):
+    try:
+        save()
+    except exc.IntegrityError:
+        db.session.rollback()
+        abort(422)
+    menu.invalidate()
+
 ## ROUTES
 '''
-@TODO implement endpoint
-    GET /drinks
-        it should be a public endpoint
-        it should contain only the drink.short() data representation
+GET /drinks
+    it should be a public endpoint
+    it should contain only the drink.short() data representation
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
-        or appropriate status code indicating reason for failure
+        or 304 if the If-None-Match header names the menu's current ETag
 '''
+@app.route('/drinks')
+def get_drinks():
+    return menu.response('drinks', lambda: {
+        'success': True,
+        'drinks': [drink.short() for drink in Drink.query.order_by(Drink.id).all()]
+    })
 
 
 '''
-@TODO implement endpoint
-    GET /drinks-detail
-        it should require the 'get:drinks-detail' permission
-        it should contain the drink.long() data representation
+GET /drinks-detail
+    it should require the 'get:drinks-detail' permission, checked before the cache is consulted
+    it should contain the drink.long() data representation
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
+        or 304 if the If-None-Match header names the menu's current ETag
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks-detail')
+@requires_auth('get:drinks-detail')
+def get_drinks_detail(payload):
+    return menu.response('drinks-detail', lambda: {
+        'success': True,
+        'drinks': [drink.long() for drink in Drink.query.order_by(Drink.id).all()]
+    }, cache_control='private, no-cache')
 
 
 '''
-@TODO implement endpoint
-    POST /drinks
-        it should create a new row in the drinks table
-        it should require the 'post:drinks' permission
-        it should contain the drink.long() data representation
+POST /drinks
+    it should create a new row in the drinks table
+    it should require the 'post:drinks' permission
+    it should contain the drink.long() data representation
     returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the newly created drink
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks', methods=['POST'])
+@requires_auth('post:drinks')
+def create_drink(payload):
+    drink = drink_from_request(Drink())
+    save_drink(drink.insert)
+    return jsonify({
+        'success': True,
+        'drinks': [drink.long()]
+    })
 
 
 '''
-@TODO implement endpoint
-    PATCH /drinks/<id>
-        where <id> is the existing model id
-        it should respond with a 404 error if <id> is not found
-        it should update the corresponding row for <id>
-        it should require the 'patch:drinks' permission
-        it should contain the drink.long() data representation
+PATCH /drinks/<id>
+    where <id> is the existing model id
+    it should respond with a 404 error if <id> is not found
+    it should update the corresponding row for <id>
+    it should require the 'patch:drinks' permission
+    it should contain the drink.long() data representation
     returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the updated drink
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks/<int:id>', methods=['PATCH'])
+@requires_auth('patch:drinks')
+def update_drink(payload, id):
+    drink = Drink.query.filter(Drink.id == id).one_or_none()
+    if drink is None:
+        abort(404)
+
+    drink_from_request(drink)
+    save_drink(drink.update)
+    return jsonify({
+        'success': True,
+        'drinks': [drink.long()]
+    })
 
 
 '''
-@TODO implement endpoint
-    DELETE /drinks/<id>
-        where <id> is the existing model id
-        it should respond with a 404 error if <id> is not found
-        it should delete the corresponding row for <id>
-        it should require the 'delete:drinks' permission
+DELETE /drinks/<id>
+    where <id> is the existing model id
+    it should respond with a 404 error if <id> is not found
+    it should delete the corresponding row for <id>
+    it should require the 'delete:drinks' permission
     returns status code 200 and json {"success": True, "delete": id} where id is the id of the deleted record
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks/<int:id>', methods=['DELETE'])
+@requires_auth('delete:drinks')
+def delete_drink(payload, id):
+    drink = Drink.query.filter(Drink.id == id).one_or_none()
+    if drink is None:
+        abort(404)
+
+    save_drink(drink.delete)
+    return jsonify({
+        'success': True,
+        'delete': id
+    })
 
 
 ## Error Handling
@@ -88,8 +176,8 @@ def unprocessable(error):
                     }), 422
 
 '''
-@TODO implement error handlers using the @app.errorhandler(error) decorator
-    each error handler should return (with approprate messages):
+Error handlers
+    each error handler returns (with approprate messages):
              jsonify({
                     "success": False, 
                     "error": 404,
@@ -97,14 +185,30 @@ def unprocessable(error):
                     }), 404
 
 '''
+@app.errorhandler(400)
+def bad_request(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 400,
+                    "message": "bad request"
+                    }), 400
 
-'''
-@TODO implement error handler for 404
-    error handler should conform to general task above 
-'''
-
+@app.errorhandler(404)
+def not_found(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 404,
+                    "message": "resource not found"
+                    }), 404
 
 '''
-@TODO implement error handler for AuthError
-    error handler should conform to general task above 
+AuthError handler
+    responds with the status code of the error and its description
 '''
+@app.errorhandler(AuthError)
+def auth_error(error):
+    return jsonify({
+                    "success": False, 
+                    "error": error.status_code,
+                    "message": error.error['description']
+                    }), error.status_code
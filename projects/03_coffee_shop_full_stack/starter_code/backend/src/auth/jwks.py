@@ -0,0 +1,122 @@
+'''
+JSON Web Key Set store.
+
+Keeps the signing keys of a JWKS endpoint in memory, keyed by `kid`, so
+verifying a token costs a dict lookup instead of an HTTP round trip.
+
+- Keys are kept for `ttl` seconds. Within `refresh_ahead` seconds of expiry,
+  a lookup triggers a refresh in a background thread and still returns the
+  cached key.
+- Only one fetch runs at a time. Concurrent callers that need fresh keys
+  wait for it instead of fetching themselves.
+- An unknown `kid` (the provider rotated its keys) forces a fetch, at most
+  once every `min_refetch_interval` seconds, so tokens with made-up key ids
+  cannot be used to hammer the provider.
+- If a fetch fails, the previous keys are served until a later fetch
+  succeeds.
+
+The keys come from `url`, or from any `fetch` callable returning the parsed
+JWKS document, so tests can point the store at a local stand-in.
+'''
+
+import json
+import threading
+import time
+from urllib.request import urlopen
+
+KEY_FIELDS = ('kty', 'kid', 'use', 'n', 'e')
+
+def fetch_url(url, timeout=5):
+    with urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+def parse_keys(jwks):
+    '''The kid -> key dict of a JWKS document, keeping the fields jose needs.'''
+    return {
+        key['kid']: {field: key[field] for field in KEY_FIELDS if field in key}
+        for key in jwks.get('keys', [])
+        if 'kid' in key
+    }
+
+
+class JWKSKeyStore(object):
+
+    def __init__(self, url=None, fetch=None, ttl=600, refresh_ahead=60, min_refetch_interval=30):
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.min_refetch_interval = min_refetch_interval
+        self.lock = threading.Lock()
+        self.fetched = threading.Condition(self.lock)
+        self.configure(url, fetch)
+
+    def configure(self, url=None, fetch=None):
+        '''Point the store at another JWKS source and drop the cached keys.'''
+        with self.lock:
+            self.fetch = fetch if fetch is not None else (lambda: fetch_url(url))
+            self.keys = {}
+            self.expires = 0
+            self.last_fetch = None
+            self.fetching = False
+            self.fetches = 0
+            self.errors = 0
+
+    def get(self, kid):
+        '''The key with id `kid`, or None if the provider has no such key.'''
+        now = time.monotonic()
+        with self.lock:
+            key = self.keys.get(kid)
+            fresh = now < self.expires
+            refetch_allowed = self.last_fetch is None or now - self.last_fetch >= self.min_refetch_interval
+
+        if key is not None and fresh:
+            if now >= self.expires - self.refresh_ahead:
+                self.refresh_in_background()
+            return key
+
+        if not refetch_allowed:
+            # stale key while the provider is failing, or None for an unknown kid
+            return key
+        self.refresh()
+        with self.lock:
+            return self.keys.get(kid)
+
+    def refresh(self):
+        '''Fetch the keys, or wait for the fetch already running.'''
+        with self.lock:
+            if self.fetching:
+                self.fetched.wait_for(lambda: not self.fetching)
+                return
+            self.fetching = True
+        self._fetch()
+
+    def refresh_in_background(self):
+        with self.lock:
+            if self.fetching:
+                return
+            self.fetching = True
+        threading.Thread(target=self._fetch, daemon=True).start()
+
+    def _fetch(self):
+        try:
+            keys = parse_keys(self.fetch())
+        except Exception:
+            keys = None
+
+        with self.lock:
+            self.last_fetch = time.monotonic()
+            self.fetches += 1
+            if keys is None:
+                self.errors += 1
+            else:
+                self.keys = keys
+                self.expires = self.last_fetch + self.ttl
+            self.fetching = False
+            self.fetched.notify_all()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'keys': len(self.keys),
+                'fetches': self.fetches,
+                'errors': self.errors
+            }
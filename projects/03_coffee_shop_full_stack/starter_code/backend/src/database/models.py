@@ -1,5 +1,10 @@
 import os
-from sqlalchemy import Column, String, Integer
+from collections import OrderedDict
+from threading import Lock
+from sqlalchemy import Column, String, Integer, Text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import validates
+from sqlalchemy.types import TypeDecorator
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -29,6 +34,91 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+Memo
+    a bounded, least recently used first out, thread-safe dict
+    holds the values shared between the rows loaded by successive requests
+'''
+class Memo(object):
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+'''
+JSONEncoded
+    a JSON value column
+    stored as JSONB on postgres, and as JSON text elsewhere (sqlite)
+    either way the attribute holds the decoded value
+    on sqlite, the values decoded from recently read texts are reused, so a row
+    read again by a later request is not decoded again, and rows with unchanged
+    text share one value: treat it as read-only, assign a new one to change it
+'''
+decoded_json = Memo()
+
+class JSONEncoded(TypeDecorator):
+    impl = Text
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(Text())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return json.dumps(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name == 'postgresql':
+            return value
+        decoded = decoded_json.get(value)
+        if decoded is None:
+            decoded = json.loads(value)
+            decoded_json.put(value, decoded)
+        return decoded
+
+'''
+parse_recipe(recipe)
+    the recipe as a list of ingredients
+    accepts the list, a single ingredient, or either one as a json string
+    raises ValueError if an ingredient has no color, name or parts
+'''
+def parse_recipe(recipe):
+    if isinstance(recipe, (str, bytes)):
+        recipe = json.loads(recipe)
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    if not isinstance(recipe, list) or not recipe:
+        raise ValueError('recipe must be a non-empty list of ingredients')
+    for ingredient in recipe:
+        if not isinstance(ingredient, dict) or not {'color', 'name', 'parts'} <= ingredient.keys():
+            raise ValueError('recipe ingredients need a color, a name and parts')
+    return recipe
+
+'''
+drink_forms
+    the short and long forms of recently served drinks, by drink id
+    an entry is used only while the drink's title and recipe are those it was
+    built from, so each version of a row is projected once across requests
+'''
+drink_forms = Memo()
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -38,33 +128,59 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
+    # the ingredients blob - parsed once per loaded row, see JSONEncoded
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    # assign a new recipe rather than changing the list in place, so the change is tracked
+    recipe =  Column(JSONEncoded, nullable=False)
+
+    '''
+    recipe validation
+        recipes given as json strings are parsed here, once
+    '''
+    @validates('recipe')
+    def validate_recipe(self, key, recipe):
+        return parse_recipe(recipe)
 
     '''
     short()
         short form representation of the Drink model
+        memoized in drink_forms
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': short_recipe
-        }
+        forms = self.forms()
+        if 'short' not in forms:
+            forms['short'] = {
+                'id': self.id,
+                'title': self.title,
+                'recipe': [{'color': r['color'], 'parts': r['parts']} for r in self.recipe]
+            }
+        return forms['short']
 
     '''
     long()
         long form representation of the Drink model
+        memoized in drink_forms
     '''
     def long(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': json.loads(self.recipe)
-        }
+        forms = self.forms()
+        if 'long' not in forms:
+            forms['long'] = {
+                'id': self.id,
+                'title': self.title,
+                'recipe': self.recipe
+            }
+        return forms['long']
+
+    def forms(self):
+        if self.id is None:
+            # not flushed yet, the id is still to come
+            return {}
+        entry = drink_forms.get(self.id)
+        # the same recipe object when it came from decoded_json, an equal one otherwise
+        if entry is None or entry[0] != self.title or not (entry[1] is self.recipe or entry[1] == self.recipe):
+            entry = (self.title, self.recipe, {})
+            drink_forms.put(self.id, entry)
+        return entry[2]
 
     '''
     insert()
@@ -104,4 +220,4 @@ class Drink(db.Model):
         db.session.commit()
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return json.dumps(self.short())
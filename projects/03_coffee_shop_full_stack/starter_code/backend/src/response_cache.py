@@ -0,0 +1,86 @@
+'''
+Serialized-response cache.
+
+Keeps the encoded JSON body of read-mostly responses (the drink menu) in
+memory, together with a strong ETag derived from the body, so repeated
+requests neither query the database nor encode JSON again, and clients
+sending a matching If-None-Match get an empty 304.
+
+Write handlers call `invalidate()` after committing. A body built while an
+invalidation happened is served but not cached, so a stale menu never
+outlives the write that changed it in the same process. The cache is per
+process, so other workers only see that write once their bodies are older
+than `max_age` seconds and get rebuilt: that is the most a menu (and its
+ETag) can lag behind the database.
+'''
+
+import hashlib
+import json
+import time
+from threading import Lock
+
+from flask import Response, request
+
+
+class CachedBody(object):
+
+    def __init__(self, body, expires):
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.expires = expires
+
+
+class ResponseCache(object):
+
+    def __init__(self, max_age=30):
+        self.max_age = max_age
+        self.bodies = {}
+        self.generation = 0
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        '''The cached body for `key`, built from the data `build()` returns if missing.'''
+        now = time.monotonic()
+        with self.lock:
+            cached = self.bodies.get(key)
+            generation = self.generation
+            if cached is not None and cached.expires > now:
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        body = json.dumps(build(), separators=(',', ':')).encode()
+        cached = CachedBody(body, now + self.max_age)
+        with self.lock:
+            if self.generation == generation:
+                self.bodies[key] = cached
+        return cached
+
+    def response(self, key, build, cache_control='no-cache'):
+        '''
+        A 200 response with the cached body of `key`, or an empty 304 when
+        the request's If-None-Match already names its ETag.
+        '''
+        cached = self.get(key, build)
+        if request.if_none_match.contains(cached.etag):
+            response = Response(status=304)
+        else:
+            response = Response(cached.body, mimetype='application/json')
+        response.set_etag(cached.etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    def invalidate(self):
+        with self.lock:
+            self.bodies.clear()
+            self.generation += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.bodies),
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -2,9 +2,9 @@ from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 
 from app import app
-from models import db
+from models import db, include_object
 
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, include_object=include_object)
 manager = Manager(app)
 
 manager.add_command('db', MigrateCommand)
@@ -1,8 +1,13 @@
-from sqlalchemy import Column, String, create_engine
+import os
+import hashlib
+from sqlalchemy import Column, String, Integer, MetaData, Table, create_engine
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.schema import CreateTable, CreateIndex
 from flask_sqlalchemy import SQLAlchemy
 import json
 
 database_path = os.environ['DATABASE_URL']
+schema_bootstrap = os.environ.get('SCHEMA_BOOTSTRAP', 'auto')
 
 db = SQLAlchemy()
 
@@ -15,7 +20,63 @@ def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
-    db.create_all()
+    bootstrap_schema(app.config.get("SCHEMA_BOOTSTRAP", schema_bootstrap))
+
+'''
+bootstrap_schema(mode)
+    creates the tables missing from the database, depending on `mode`:
+    "create_all" checks every table each time an app is set up,
+    "migrations" leaves the schema to `python manage.py db upgrade`,
+    "auto" runs create_all only when the models changed since the
+    fingerprint stored in the schema_stamp table, so a worker that boots
+    against an up-to-date database pays a single query
+'''
+schema_stamp = Table('schema_stamp', MetaData(), Column('fingerprint', String, primary_key=True))
+bootstrapped = set()
+
+'''
+include_object(object, name, type_, reflected, compare_to)
+    keeps schema_stamp out of migration autogenerate: it lives outside the
+    models' metadata, so alembic would otherwise emit a drop_table for it
+'''
+def include_object(object, name, type_, reflected, compare_to):
+    return not (type_ == "table" and name == schema_stamp.name)
+
+def schema_fingerprint(dialect):
+    statements = []
+    for table in db.metadata.sorted_tables:
+        statements.append(str(CreateTable(table).compile(dialect=dialect)))
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            statements.append(str(CreateIndex(index).compile(dialect=dialect)))
+    return hashlib.sha256('\n'.join(statements).encode()).hexdigest()
+
+def bootstrap_schema(mode="auto"):
+    if mode == "migrations":
+        return
+    if mode == "create_all":
+        db.create_all()
+        return
+    if mode != "auto":
+        raise ValueError("Unknown SCHEMA_BOOTSTRAP mode: {}".format(mode))
+
+    engine = db.get_engine()
+    fingerprint = schema_fingerprint(engine.dialect)
+    if (str(engine.url), fingerprint) in bootstrapped:
+        return
+
+    with engine.connect() as connection:
+        try:
+            stamped = connection.execute(schema_stamp.select()).scalar()
+        except ProgrammingError:
+            stamped = None
+
+    if stamped != fingerprint:
+        db.create_all()
+        with engine.begin() as connection:
+            schema_stamp.create(connection, checkfirst=True)
+            connection.execute(schema_stamp.delete())
+            connection.execute(schema_stamp.insert().values(fingerprint=fingerprint))
+    bootstrapped.add((str(engine.url), fingerprint))
 
 
 '''